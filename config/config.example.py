@@ -50,6 +50,8 @@ RETRIEVAL_CONFIG = {
     "top_k": 60,  # 从20增加到60，提升通用检索能力
     "similarity_threshold": 0.7,
     "max_contexts_per_query": 100000,  # 大幅增加到100K字符，充分利用长上下文
+    "ef_search": None,  # HNSW索引的搜索宽度（None使用索引默认值，仅HNSW索引生效）
+    "quantized_search": False,  # 是否先在8位量化索引上检索候选再用FP32重排（大规模语料时减少内存带宽）
     
     # 单省份查询配置
     "single_province": {
@@ -83,11 +85,29 @@ RETRIEVAL_CONFIG = {
     }
 }
 
+# 向量存储配置
+VECTOR_STORE_CONFIG = {
+    "backend": "faiss",  # 检索后端："faiss"（CPU），或 "cagra"（GPU图索引，需要安装cuVS和CuPy）
+    "index_type": "auto",  # FAISS索引："flat"（精确）、"hnsw"、"ivf"、"ivfpq"（乘积量化）、"sq8"/"fp16"（标量量化）、"hnsw_sq"，量化索引检索后精确重排；"auto"按向量数量选择（<1万flat，<100万hnsw，否则ivfpq）
+    "hnsw_m": 32,  # HNSW每个节点的邻居数
+    "ef_construction": 200,  # HNSW构建时的搜索宽度
+    "ef_search": 64,  # HNSW检索时的搜索宽度（越大召回越高、越慢）
+    "nprobe": 16,  # IVF检索时访问的聚类数（越大召回越高、越慢）
+    "mmap": True,  # 加载索引时内存映射FAISS索引和embeddings文件（启动快、内存占用低）
+    "embedding_dtype": "float32",  # 保存的文档向量精度："float32"，或 "float16"（内存和磁盘减半，用于精确重排）
+    "omp_threads": None,  # FAISS线程数，None为不修改（FAISS默认值）；embedding模型在CPU上推理时可调小，避免与PyTorch线程争抢
+    "blas_threshold": 8,  # 批量检索的查询数达到该值时使用BLAS矩阵乘法（FAISS默认20）
+}
+
 # 查询处理配置
 QUERY_CONFIG = {
     "batch_size": 8,  # 每批处理的省份数量
     "max_retries": 3,
-    "timeout": 120  # 从30秒增加到120秒，适应长上下文处理
+    "timeout": 120,  # 从30秒增加到120秒，适应长上下文处理
+    "merge_max_tokens": 8192,  # 多个小批次合并为一次调用时的输出token预算（不能超过模型支持的最大输出）
+    "merge_max_context_chars": 100000,  # 合并调用中各部分参考资料的总字符数上限（超出时拆成多次调用）
+    "use_tiktoken": True,  # 用tiktoken精确统计结果的token数（首次使用需下载编码文件；离线环境可设为False，按字符数估算）
+    "keyword_stats": False  # 是否统计范围/复杂度关键词的命中次数（QueryRouter.get_keyword_stats）
 }
 
 # 省份列表
@@ -63,7 +63,8 @@ def rebuild_index():
         print(f"🏗️ 创建新的向量存储 (维度: {current_dim})...")
         vector_store = VectorStore(
             store_path=str(DATA_PATHS["vector_store"]),
-            embedding_dim=current_dim
+            embedding_dim=current_dim,
+            embedding_manager=embedding_manager
         )
         
         # 5. 构建新索引
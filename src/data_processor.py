@@ -10,7 +10,7 @@ import re
 import json
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field, fields, asdict, MISSING
 import logging
 
 # 导入文档处理库
@@ -22,7 +22,7 @@ from tqdm import tqdm
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class DocumentChunk:
     """文档块数据结构"""
     id: str
@@ -35,6 +35,22 @@ class DocumentChunk:
     start_pos: int = 0  # 添加start_pos属性
     end_pos: int = 0  # 添加end_pos属性
     chunk_id: int = 0  # 添加chunk_id属性
+    word_count: int = field(default=-1, compare=False)  # 空白分词后的词数（-1表示未计算）
+    
+    def __post_init__(self):
+        if self.word_count < 0:
+            self.word_count = len(self.content.split())
+    
+    def __setstate__(self, state):
+        """反序列化：兼容旧版索引中以__dict__保存的块，缺失的字段使用默认值"""
+        if isinstance(state, tuple):  # (__dict__状态, __slots__状态)
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for f in fields(self):
+            if f.name in state:
+                setattr(self, f.name, state[f.name])
+            elif f.default is not MISSING:
+                setattr(self, f.name, f.default)
+        self.__post_init__()
     
     def to_dict(self) -> Dict:
         """转换为字典格式"""
@@ -7,8 +7,10 @@ Jina Embeddings v4 模型管理器
 
 import logging
 import os
+from contextlib import nullcontext
+from itertools import islice
 from pathlib import Path
-from typing import List, Union
+from typing import Iterable, List, Optional, Union
 
 import numpy as np
 import torch
@@ -58,6 +60,7 @@ class JinaEmbeddingManager:
         # 设置attention实现
         self.attn_implementation = attn_implementation
         self.model = None
+        self._encode_stream = None  # 编码专用的CUDA流（首次在GPU上编码时创建）
 
         logger.info("🚀 初始化Jina Embedding管理器")
         logger.info(f"📱 设备: {self.device}")
@@ -176,21 +179,23 @@ class JinaEmbeddingManager:
 
     def encode_texts(
         self,
-        texts: Union[str, List[str]],
+        texts: Union[str, Iterable[str]],
         task: str = "retrieval",
         prompt_name: str = "passage",
         batch_size: int = 32,
         show_progress: bool = True,
+        total: Optional[int] = None,
     ) -> np.ndarray:
         """
         将文本编码为向量 - 使用官方API
 
         Args:
-            texts: 单个文本或文本列表
+            texts: 单个文本、文本列表或任意文本迭代器（按批次逐步读取）
             task: 任务类型 ("retrieval", "text-matching", "code")
             prompt_name: 提示名称 ("query", "passage")
             batch_size: 批处理大小
             show_progress: 是否显示进度条
+            total: 文本总数（texts为迭代器时用于显示进度，列表可省略）
 
         Returns:
             np.ndarray: 文本向量数组
@@ -204,11 +209,24 @@ class JinaEmbeddingManager:
 
         embeddings = []
 
-        # 批处理编码
-        batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+        # 批处理编码：按批次从迭代器中读取文本，不需要预先构造完整的文本列表
+        if total is None and hasattr(texts, "__len__"):
+            total = len(texts)
+        text_iter = iter(texts)
+        batches = iter(lambda: list(islice(text_iter, batch_size)), [])
+        num_batches = None if total is None else -(-total // batch_size)
+
+        # GPU上在专用CUDA流中编码，不与默认流上的其他任务排队
+        if self.device == "cuda" and self._encode_stream is None:
+            self._encode_stream = torch.cuda.Stream()
+        stream_context = (
+            torch.cuda.stream(self._encode_stream)
+            if self._encode_stream is not None
+            else nullcontext()
+        )
 
-        with torch.no_grad():
-            for batch in tqdm(batches, desc="🔄 编码文本", disable=not show_progress):
+        with torch.no_grad(), stream_context:
+            for batch in tqdm(batches, desc="🔄 编码文本", total=num_batches, disable=not show_progress):
                 try:
                     # 使用官方API进行编码
                     batch_embeddings = self.model.encode_text(
@@ -217,16 +235,20 @@ class JinaEmbeddingManager:
 
                     # encode_text返回的是list，需要处理每个元素
                     if isinstance(batch_embeddings, list):
-                        # 转换list中的每个tensor
-                        numpy_batch = []
-                        for emb in batch_embeddings:
-                            if isinstance(emb, torch.Tensor):
-                                numpy_batch.append(emb.detach().cpu().numpy())
-                            else:
-                                numpy_batch.append(emb)
-                        batch_embeddings = np.array(numpy_batch)
+                        if all(isinstance(emb, torch.Tensor) for emb in batch_embeddings):
+                            # 在设备上合并后整批拷回，而不是逐个向量同步拷贝
+                            batch_embeddings = self._tensor_to_numpy(torch.stack(batch_embeddings))
+                        else:
+                            # 转换list中的每个tensor
+                            numpy_batch = []
+                            for emb in batch_embeddings:
+                                if isinstance(emb, torch.Tensor):
+                                    numpy_batch.append(emb.detach().cpu().numpy())
+                                else:
+                                    numpy_batch.append(emb)
+                            batch_embeddings = np.array(numpy_batch)
                     elif isinstance(batch_embeddings, torch.Tensor):
-                        batch_embeddings = batch_embeddings.detach().cpu().numpy()
+                        batch_embeddings = self._tensor_to_numpy(batch_embeddings)
 
                     embeddings.append(batch_embeddings)
 
@@ -244,12 +266,28 @@ class JinaEmbeddingManager:
                 else:
                     numpy_embeddings.append(emb)
 
-            result = np.vstack(numpy_embeddings)
+            # 统一为float32连续数组，向量库加入索引和检索时无需再转换
+            result = np.ascontiguousarray(np.vstack(numpy_embeddings), dtype=np.float32)
             logger.info(f"✅ 编码完成，形状: {result.shape}")
             return result
         else:
             raise ValueError("编码失败，没有生成任何向量")
 
+    def _tensor_to_numpy(self, tensor: torch.Tensor) -> np.ndarray:
+        """
+        把编码结果拷回CPU并转为numpy数组
+
+        GPU上的张量先异步拷贝到锁页内存，再只同步一次编码流，避免可分页内存上的额外拷贝。
+        """
+        tensor = tensor.detach()
+        if not tensor.is_cuda:
+            return tensor.numpy()
+
+        host = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+        host.copy_(tensor, non_blocking=True)
+        torch.cuda.current_stream().synchronize()
+        return host.numpy()
+
     def encode_query(self, query: str) -> np.ndarray:
         """
         编码查询文本
@@ -6,16 +6,44 @@
 """
 
 import logging
+import re
+from collections import Counter
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
 
 from api_client import get_api_client
-from retriever import get_retriever
+from config.config import PROVINCES, QUERY_CONFIG, RETRIEVAL_CONFIG, SILICONFLOW_CONFIG
+from retriever import RetrievalResult, get_retriever
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 省份元组（模块加载时构建一次，供热点循环遍历）
+_PROVINCES_TUPLE = tuple(PROVINCES)
+
+# 按指定省份检索的批次类型
+_SPECIFIC_BATCH_TYPES = frozenset({"province_group", "province_chunk"})
+
+# 合并批次时每个省份预估占用的输出token数（按省份列表格式每省约5个目标估算）
+_MERGE_TOKENS_PER_PROVINCE = 250
+
+
+# 范围与复杂度判断的关键词规则
+_SCOPE_RULES = {
+    "comprehensive": ("所有", "全部", "全国", "31省"),
+    "partial": ("部分", "某些", "几个"),
+}
+_COMPLEXITY_RULES = {
+    "coverage": (("所有省份", "31省", "全国"), 2),
+    "analysis": (("对比", "分析", "统计"), 1),
+    "depth": (("详细", "深入", "全面"), 1),
+}
+
+# 合并批次回答中的分段标题，如「【第1部分】」
+_MERGED_SECTION_RE = re.compile(r"【第(\d+)部分】")
+
 
 @dataclass
 class QueryPlan:
@@ -87,6 +115,22 @@ class QueryRouter:
             },
         }
 
+        # 关键词命中统计（用于分析并精简关键词规则）；只在配置开启或DEBUG日志时逐词统计，
+        # 否则路由判断在首个命中的关键词处短路
+        self.collect_keyword_stats = QUERY_CONFIG.get("keyword_stats", False)
+        self.keyword_hits = Counter()
+
+        # 批次类型到检索方法的分派表（未登记的类型走智能检索）
+        self._retrieval_dispatch = {
+            "all_provinces": lambda b: self.retriever.smart_retrieve(b["query"]),
+            "province_group": lambda b: self.retriever.retrieve_for_specific_provinces(
+                b["query"], b["provinces"]
+            ),
+            "province_chunk": lambda b: self.retriever.retrieve_for_specific_provinces(
+                b["query"], b["provinces"]
+            ),
+        }
+
         logger.info("🎯 查询路由器初始化完成")
 
     def analyze_query(self, query: str) -> Dict[str, Any]:
@@ -101,12 +145,14 @@ class QueryRouter:
         """
         logger.info(f"🔍 分析查询: {query}")
 
+        intent = self._identify_intent(query)
+
         analysis = {
             "original_query": query,
-            "intent": self._identify_intent(query),
+            "intent": intent,
             "scope": self._determine_scope(query),
             "output_format": self._determine_output_format(query),
-            "complexity": self._assess_complexity(query),
+            "complexity": self._assess_complexity(query, intent["provinces"]),
         }
 
         logger.debug(f"📊 查询分析结果: {analysis}")
@@ -170,24 +216,32 @@ class QueryRouter:
         logger.info(f"🚀 执行查询计划: {plan.batch_strategy}")
 
         results = []
+        failed_batches = 0
         all_provinces = set()
         total_processing_time = 0
 
-        for i, batch in enumerate(plan.batches):
-            logger.info(f"📦 处理批次 {i + 1}/{len(plan.batches)}")
+        # 合并可共享同一次API调用的小批次
+        batches = self._maybe_merge_batches(plan)
+
+        for i, batch in enumerate(batches):
+            logger.info(f"📦 处理批次 {i + 1}/{len(batches)}")
 
             try:
                 batch_result = self._execute_single_batch(batch, plan.output_format)
-                if batch_result["success"]:
-                    results.append(batch_result)
-                    all_provinces.update(batch_result.get("provinces", []))
-                    total_processing_time += batch_result.get("processing_time", 0)
-                else:
-                    logger.warning(
-                        f"⚠️ 批次 {i + 1} 执行失败: {batch_result.get('error')}"
-                    )
+                # 合并批次按子批次拆回结果，保持下游聚合不变
+                for sub_result in batch_result.get("sub_results", [batch_result]):
+                    if sub_result["success"]:
+                        results.append(sub_result)
+                        all_provinces.update(sub_result.get("provinces", []))
+                    else:
+                        failed_batches += 1
+                        logger.warning(
+                            f"⚠️ 批次 {i + 1} 执行失败: {sub_result.get('error')}"
+                        )
+                total_processing_time += batch_result.get("processing_time", 0)
 
             except Exception as e:
+                failed_batches += 1
                 logger.error(f"❌ 批次 {i + 1} 执行异常: {str(e)}")
 
         # 聚合结果
@@ -196,6 +250,7 @@ class QueryRouter:
             {
                 "total_batches": len(plan.batches),
                 "successful_batches": len(results),
+                "failed_batches": failed_batches,
                 "total_provinces": len(all_provinces),
                 "total_processing_time": total_processing_time,
             }
@@ -204,14 +259,110 @@ class QueryRouter:
         logger.info(f"✅ 查询执行完成: {len(results)}/{len(plan.batches)} 批次成功")
         return final_result
 
+    def _maybe_merge_batches(self, plan: QueryPlan) -> List[Dict]:
+        """
+        将多个小批次合并为一次API调用
+
+        同一计划内的批次输出格式相同，只要预估输出不超过合并调用的输出预算
+        （QUERY_CONFIG["merge_max_tokens"]），相邻的省份批次即可合并，
+        减少网络往返和重复的指令token。合并批次的API调用使用该预算作为max_tokens。
+        参考资料的长度在检索后才能确定，执行时再按输入预算拆分（见 _execute_merged_batch）。
+
+        Args:
+            plan: 查询执行计划
+
+        Returns:
+            List[Dict]: 合并后的批次列表
+        """
+        if len(plan.batches) <= 1:
+            return plan.batches
+
+        token_budget = QUERY_CONFIG.get("merge_max_tokens", SILICONFLOW_CONFIG["max_tokens"])
+
+        merged_batches = []
+        pending = []
+        pending_tokens = 0
+
+        def flush():
+            if len(pending) > 1:
+                merged_batches.append(
+                    self._make_merged_batch(
+                        list(pending),
+                        max(token_budget, SILICONFLOW_CONFIG["max_tokens"]),
+                    )
+                )
+            else:
+                merged_batches.extend(pending)
+            pending.clear()
+
+        for batch in plan.batches:
+            if batch["type"] not in _SPECIFIC_BATCH_TYPES:
+                flush()
+                pending_tokens = 0
+                merged_batches.append(batch)
+                continue
+
+            batch_tokens = len(batch["provinces"]) * _MERGE_TOKENS_PER_PROVINCE
+            if pending and pending_tokens + batch_tokens > token_budget:
+                flush()
+                pending_tokens = 0
+
+            pending.append(batch)
+            pending_tokens += batch_tokens
+
+        flush()
+
+        if len(merged_batches) < len(plan.batches):
+            logger.info(
+                f"🔗 合并批次: {len(plan.batches)} -> {len(merged_batches)} 次API调用"
+            )
+
+        return merged_batches
+
+    def _make_merged_batch(self, sub_batches: List[Dict], max_tokens: int) -> Dict:
+        """由多个子批次构建合并批次"""
+        return {
+            "type": "merged",
+            "sub_batches": sub_batches,
+            "provinces": [p for b in sub_batches for p in b["provinces"]],
+            "query": "\n".join(b["query"] for b in sub_batches),
+            "max_tokens": max_tokens,
+        }
+
+    def _group_by_context_chars(self, contexts: List[str]) -> List[List[int]]:
+        """
+        按参考资料长度把相邻子批次分组，每组总字符数不超过合并调用的输入预算
+
+        单个子批次超过预算时自成一组（与不合并时相同，单独调用）。
+
+        Args:
+            contexts: 各子批次的参考资料
+
+        Returns:
+            List[List[int]]: 各组包含的子批次下标
+        """
+        budget = QUERY_CONFIG.get(
+            "merge_max_context_chars", RETRIEVAL_CONFIG["max_contexts_per_query"]
+        )
+
+        groups = []
+        group_chars = 0
+        for i, context in enumerate(contexts):
+            if groups and group_chars + len(context) <= budget:
+                groups[-1].append(i)
+                group_chars += len(context)
+            else:
+                groups.append([i])
+                group_chars = len(context)
+
+        return groups
+
     def _identify_intent(self, query: str) -> Dict[str, Any]:
         """识别查询意图"""
         intent = {"type": "general", "provinces": [], "topics": [], "actions": []}
 
         # 检查省份提及
-        from config.config import PROVINCES
-
-        mentioned_provinces = [p for p in PROVINCES if p in query]
+        mentioned_provinces = [p for p in _PROVINCES_TUPLE if p in query]
         intent["provinces"] = mentioned_provinces
 
         # 检查查询类型
@@ -248,14 +399,34 @@ class QueryRouter:
 
         return intent
 
+    def _match_keywords(self, rule: str, keywords: Tuple[str, ...], query: str) -> bool:
+        """匹配关键词规则（开启统计时记录查询中出现的每个关键词）"""
+        if not (self.collect_keyword_stats or logger.isEnabledFor(logging.DEBUG)):
+            return any(keyword in query for keyword in keywords)
+
+        matched = [keyword for keyword in keywords if keyword in query]
+        for keyword in matched:
+            self.keyword_hits[(rule, keyword)] += 1
+        return bool(matched)
+
+    def get_keyword_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取关键词命中统计（需开启 QUERY_CONFIG["keyword_stats"] 或DEBUG日志）
+
+        Returns:
+            Dict[str, Dict[str, int]]: 规则名到{关键词: 命中次数}的映射
+        """
+        stats = {}
+        for (rule, keyword), count in self.keyword_hits.most_common():
+            stats.setdefault(rule, {})[keyword] = count
+        return stats
+
     def _determine_scope(self, query: str) -> str:
         """确定查询范围"""
-        if any(keyword in query for keyword in ["所有", "全部", "全国", "31省"]):
-            return "comprehensive"
-        elif any(keyword in query for keyword in ["部分", "某些", "几个"]):
-            return "partial"
-        else:
-            return "specific"
+        for scope, keywords in _SCOPE_RULES.items():
+            if self._match_keywords(f"scope.{scope}", keywords, query):
+                return scope
+        return "specific"
 
     def _determine_output_format(self, query: str) -> str:
         """确定输出格式"""
@@ -270,24 +441,20 @@ class QueryRouter:
         else:
             return "province_list"  # 默认格式
 
-    def _assess_complexity(self, query: str) -> str:
-        """评估查询复杂度"""
+    def _assess_complexity(
+        self, query: str, mentioned_provinces: Optional[List[str]] = None
+    ) -> str:
+        """评估查询复杂度（可复用意图识别已找到的省份，避免重复扫描）"""
         complexity_indicators = 0
 
         # 检查复杂度指标
-        if any(keyword in query for keyword in ["所有省份", "31省", "全国"]):
-            complexity_indicators += 2
-
-        if any(keyword in query for keyword in ["对比", "分析", "统计"]):
-            complexity_indicators += 1
-
-        if any(keyword in query for keyword in ["详细", "深入", "全面"]):
-            complexity_indicators += 1
+        for rule, (keywords, weight) in _COMPLEXITY_RULES.items():
+            if self._match_keywords(f"complexity.{rule}", keywords, query):
+                complexity_indicators += weight
 
         # 检查省份数量
-        from config.config import PROVINCES
-
-        mentioned_provinces = [p for p in PROVINCES if p in query]
+        if mentioned_provinces is None:
+            mentioned_provinces = [p for p in _PROVINCES_TUPLE if p in query]
         if len(mentioned_provinces) > 3:
             complexity_indicators += 1
 
@@ -320,8 +487,6 @@ class QueryRouter:
         self, query: str, provinces: List[str]
     ) -> List[Dict]:
         """创建省份分块批次"""
-        from config.config import QUERY_CONFIG
-
         batch_size = QUERY_CONFIG["batch_size"]
 
         batches = []
@@ -338,38 +503,35 @@ class QueryRouter:
 
         return batches
 
-    def _execute_single_batch(self, batch: Dict, output_format: str) -> Dict[str, Any]:
-        """执行单个批次"""
-        import time
+    def _execute_single_batch(
+        self,
+        batch: Dict,
+        output_format: str,
+        retrieval_result: Optional[RetrievalResult] = None,
+    ) -> Dict[str, Any]:
+        """执行单个批次（已有检索结果时直接复用，不再重复检索）"""
+        if batch["type"] == "merged":
+            return self._execute_merged_batch(batch, output_format)
 
-        start_time = time.time()
+        start = perf_counter()
 
         try:
-            # 检索相关信息
-            if batch["type"] == "all_provinces":
-                retrieval_result = self.retriever.smart_retrieve(batch["query"])
-            elif batch["type"] in ["province_group", "province_chunk"]:
-                retrieval_result = self.retriever.retrieve_for_specific_provinces(
-                    batch["query"], batch["provinces"]
-                )
-            else:
-                retrieval_result = self.retriever.smart_retrieve(batch["query"])
+            if retrieval_result is None:
+                retrieval_result = self._retrieve_for_batch(batch)
 
             # 构建提示词
             context = self.retriever.format_context(retrieval_result)
             prompt = self._build_prompt(batch["query"], context, output_format)
 
             # 调用API - 使用配置文件中的超时设置
-            from config.config import SILICONFLOW_CONFIG
-
             response = self.api_client.simple_chat(
                 prompt,
                 timeout=SILICONFLOW_CONFIG["timeout"],
                 temperature=SILICONFLOW_CONFIG["temperature"],
-                max_tokens=SILICONFLOW_CONFIG["max_tokens"],
+                max_tokens=batch.get("max_tokens", SILICONFLOW_CONFIG["max_tokens"]),
             )
 
-            processing_time = time.time() - start_time
+            processing_time = perf_counter() - start
 
             if response.success:
                 return {
@@ -391,12 +553,198 @@ class QueryRouter:
             return {
                 "success": False,
                 "error": str(e),
-                "processing_time": time.time() - start_time,
+                "processing_time": perf_counter() - start,
                 "batch_info": batch,
             }
 
-    def _build_prompt(self, query: str, context: str, output_format: str) -> str:
-        """构建API提示词 - 简化版原文提取"""
+    def _execute_merged_batch(self, batch: Dict, output_format: str) -> Dict[str, Any]:
+        """
+        执行合并批次
+
+        逐个子批次检索后，按参考资料长度分组：每组共用一次API调用（编号拼接为一个提示词），
+        只有一个子批次的组单独调用。
+
+        Returns:
+            Dict: 批次结果，sub_results为各子批次（或未能拆分的组）的结果
+        """
+        start = perf_counter()
+
+        try:
+            sub_batches = batch["sub_batches"]
+            retrieval_results = [
+                self._retrieve_for_batch(sub_batch) for sub_batch in sub_batches
+            ]
+            contexts = [
+                self.retriever.format_context(result) for result in retrieval_results
+            ]
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "processing_time": perf_counter() - start,
+                "batch_info": batch,
+            }
+
+        sub_results = []
+        for group in self._group_by_context_chars(contexts):
+            if len(group) == 1:
+                i = group[0]
+                sub_results.append(
+                    self._execute_single_batch(
+                        sub_batches[i], output_format, retrieval_results[i]
+                    )
+                )
+            else:
+                sub_results.extend(
+                    self._execute_merged_group(
+                        [sub_batches[i] for i in group],
+                        [retrieval_results[i] for i in group],
+                        [contexts[i] for i in group],
+                        output_format,
+                        batch.get("max_tokens", SILICONFLOW_CONFIG["max_tokens"]),
+                    )
+                )
+
+        successful = [r for r in sub_results if r["success"]]
+        batch_result = {
+            "success": bool(successful),
+            "provinces": list({p for r in successful for p in r["provinces"]}),
+            "processing_time": sum(r["processing_time"] for r in sub_results),
+            "batch_info": batch,
+            "sub_results": sub_results,
+        }
+        if not successful:
+            batch_result["error"] = sub_results[0].get("error")
+        return batch_result
+
+    def _execute_merged_group(
+        self,
+        sub_batches: List[Dict],
+        retrieval_results: List[RetrievalResult],
+        contexts: List[str],
+        output_format: str,
+        max_tokens: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        一次API调用回答一组子批次，按编号拆回各子批次的结果
+
+        合并调用失败（如超时）时，逐个子批次复用已有的检索结果单独调用，
+        避免一次失败丢掉整组结果。
+        """
+        start = perf_counter()
+
+        try:
+            prompt = self._build_merged_prompt(sub_batches, contexts, output_format)
+            response = self.api_client.simple_chat(
+                prompt,
+                timeout=SILICONFLOW_CONFIG["timeout"],
+                temperature=SILICONFLOW_CONFIG["temperature"],
+                max_tokens=max_tokens,
+            )
+            error = None if response.success else response.error
+        except Exception as e:
+            error = str(e)
+
+        processing_time = perf_counter() - start
+
+        if error is not None:
+            logger.warning(f"⚠️ 合并调用失败，逐个子批次单独查询: {error}")
+            sub_results = [
+                self._execute_single_batch(sub_batch, output_format, result)
+                for sub_batch, result in zip(sub_batches, retrieval_results)
+            ]
+            sub_results[0]["processing_time"] += processing_time
+            return sub_results
+
+        sections = self._split_merged_response(
+            response.content, sub_batches, retrieval_results
+        )
+        if not sections:
+            return [
+                {
+                    "success": True,
+                    "content": response.content,
+                    "provinces": list(
+                        {p for result in retrieval_results for p in result.provinces}
+                    ),
+                    "processing_time": processing_time,
+                    "batch_info": self._make_merged_batch(sub_batches, max_tokens),
+                }
+            ]
+
+        for sub_result in sections.values():
+            sub_result["processing_time"] = processing_time / len(sections)
+
+        # 缺失或为空的部分（如输出被截断）单独重新查询
+        sub_results = []
+        for i, sub_batch in enumerate(sub_batches, 1):
+            if i in sections:
+                sub_results.append(sections[i])
+                continue
+            logger.warning(f"⚠️ 合并批次第{i}部分缺失，单独重新查询")
+            # 失败的结果同样保留，由调用方计入失败批次；重新查询的耗时计入批次总耗时
+            sub_results.append(
+                self._execute_single_batch(
+                    sub_batch, output_format, retrieval_results[i - 1]
+                )
+            )
+        return sub_results
+
+    def _retrieve_for_batch(self, batch: Dict) -> RetrievalResult:
+        """检索单个批次的相关信息"""
+        retrieve = self._retrieval_dispatch.get(batch["type"], self._default_retrieve)
+        return retrieve(batch)
+
+    def _default_retrieve(self, batch: Dict) -> RetrievalResult:
+        """默认检索：智能检索"""
+        return self.retriever.smart_retrieve(batch["query"])
+
+    def _split_merged_response(
+        self,
+        content: str,
+        sub_batches: List[Dict],
+        retrieval_results: List[RetrievalResult],
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        按编号标题拆分合并批次的回答
+
+        Args:
+            content: 模型返回的完整内容
+            sub_batches: 子批次列表
+            retrieval_results: 各子批次的检索结果
+
+        Returns:
+            Dict[int, Dict]: 编号（从1开始）到子批次结果的映射，只包含内容非空的部分；
+            回答中没有任何编号标题时返回空字典
+        """
+        parts = _MERGED_SECTION_RE.split(content)
+
+        # split结果形如 [前言, 编号1, 内容1, 编号2, 内容2, ...]
+        sections = {}
+        for i in range(1, len(parts) - 1, 2):
+            section = parts[i + 1].strip()
+            if section:
+                sections[int(parts[i])] = section
+
+        if not sections:
+            logger.warning("⚠️ 合并批次回答没有编号标题，按整体结果处理")
+            return {}
+
+        return {
+            i: {
+                "success": True,
+                "content": sections[i],
+                "provinces": list(result.provinces),
+                "batch_info": sub_batch,
+            }
+            for i, (sub_batch, result) in enumerate(
+                zip(sub_batches, retrieval_results), 1
+            )
+            if i in sections
+        }
+
+    def _get_format_instruction(self, output_format: str) -> str:
+        """获取输出格式要求"""
         format_instructions = {
             "province_list": """
 要求：内容必须来自政府工作报告原文，不要编造""",
@@ -414,10 +762,14 @@ class QueryRouter:
 3. 不要编造数据""",
         }
 
-        instruction = format_instructions.get(
+        return format_instructions.get(
             output_format, format_instructions["province_list"]
         )
 
+    def _build_prompt(self, query: str, context: str, output_format: str) -> str:
+        """构建API提示词 - 简化版原文提取"""
+        instruction = self._get_format_instruction(output_format)
+
         prompt = f"""请根据提供的政府工作报告内容回答用户问题。
 
 【用户问题】
@@ -436,6 +788,39 @@ class QueryRouter:
 
         return prompt
 
+    def _build_merged_prompt(
+        self, sub_batches: List[Dict], contexts: List[str], output_format: str
+    ) -> str:
+        """构建合并批次的API提示词 - 共享指令，按编号分别作答"""
+        instruction = self._get_format_instruction(output_format)
+
+        questions = "\n".join(
+            f"{i}. {sub_batch['query']}" for i, sub_batch in enumerate(sub_batches, 1)
+        )
+        references = "\n".join(
+            f"【第{i}部分参考资料】\n{context}"
+            for i, context in enumerate(contexts, 1)
+        )
+
+        prompt = f"""请根据提供的政府工作报告内容，依次回答以下{len(sub_batches)}个问题。
+
+【用户问题】
+{questions}
+
+【输出要求】
+{instruction}
+每个问题单独作答，并以独立一行的「【第N部分】」开头（N为问题编号）。
+
+【重要原则】
+所有内容必须来自政府工作报告原文，不要编造或杜撰任何信息。
+
+【参考资料】
+{references}
+
+请基于参考资料按编号回答问题。"""
+
+        return prompt
+
     def _aggregate_results(
         self, results: List[Dict], plan: QueryPlan
     ) -> Dict[str, Any]:
@@ -6,14 +6,126 @@
 """
 
 import re
+from functools import lru_cache
+from collections import Counter, defaultdict
 from typing import List, Dict, Any, Set, Tuple
 from dataclasses import dataclass
 import logging
 
+import ahocorasick
+import numpy as np
+
+# 可选依赖：用tiktoken精确统计token数
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 可选依赖：大规模目标去重时用Numba并行计算相似度矩阵
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from config.config import PROVINCES as _PROV_LIST, QUERY_CONFIG
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 省份集合（精确匹配用）；需要顺序遍历时使用_PROV_LIST
+_PROV_SET = frozenset(_PROV_LIST)
+
+# 预编译正则表达式
+_PROVINCE_PATTERN = re.compile(r'([^：:]+)(?:省|市|自治区)?[：:]')
+_PROV_PREFIX_RE = re.compile(r'^(?:' + '|'.join(map(re.escape, _PROV_LIST)) + r')[：:]?')
+
+# 省份名称常见后缀
+_PROVINCE_SUFFIXES = ('省', '市', '自治区', '特别行政区')
+
+# 目标分隔符统一映射为单一分隔字符
+_SEP_TRANS = str.maketrans({c: '\x1f' for c in '、，,；;。|'})
+
+# 目标数量超过该值时用Numba预先批量计算相似对
+_NUMBA_MIN_TARGETS = 1000
+
+# token编码器缓存（进程内只加载一次；加载失败或不可用时为None）
+_token_encoder = None
+_token_encoder_loaded = False
+
+
+def _get_token_encoder():
+    """
+    获取tiktoken编码器（首次调用时加载，之后复用）
+    
+    未安装tiktoken、配置关闭（QUERY_CONFIG["use_tiktoken"]）或加载失败时返回None，
+    由调用方按字符数估算。
+    """
+    global _token_encoder, _token_encoder_loaded
+    if _token_encoder_loaded:
+        return _token_encoder
+    _token_encoder_loaded = True
+    
+    if tiktoken is None or not QUERY_CONFIG.get("use_tiktoken", True):
+        return None
+    
+    try:
+        _token_encoder = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken编码器加载失败，使用字符数估算token: {str(e)}")
+    return _token_encoder
+
+
+def _ngram_sig(text: str, n: int = 3) -> frozenset:
+    """字符n-gram哈希签名（比单字符更能区分中文文本，比较时只需整数哈希求交）"""
+    if len(text) < n:
+        return frozenset({hash(text)})
+    return frozenset(hash(text[i:i + n]) for i in range(len(text) - n + 1))
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _similar_pairs_kernel(hashes, offsets, threshold, out):
+        """
+        批量计算目标两两相似度（下三角），与_calculate_similarity口径一致
+        
+        Args:
+            hashes: 所有目标的n-gram签名（各自升序）拼接后的数组
+            offsets: 每个目标在hashes中的起止偏移（CSR布局）
+            threshold: 相似度阈值
+            out: 输出矩阵，out[i, j]（j < i）表示目标i与目标j相似度超过阈值
+        """
+        n = offsets.shape[0] - 1
+        for i in numba.prange(n):
+            start_i = offsets[i]
+            end_i = offsets[i + 1]
+            for j in range(i):
+                start_j = offsets[j]
+                end_j = offsets[j + 1]
+                
+                # 签名大小之比低于阈值时不可能相似
+                size_i = end_i - start_i
+                size_j = end_j - start_j
+                if min(size_i, size_j) < threshold * max(size_i, size_j):
+                    continue
+                
+                # 有序签名归并求交集大小
+                common = 0
+                a = start_i
+                b = start_j
+                while a < end_i and b < end_j:
+                    if hashes[a] == hashes[b]:
+                        common += 1
+                        a += 1
+                        b += 1
+                    elif hashes[a] < hashes[b]:
+                        a += 1
+                    else:
+                        b += 1
+                
+                max_size = max(end_i - start_i, end_j - start_j)
+                out[i, j] = max_size > 0 and common / max_size > threshold
+
 @dataclass
 class AggregatedResult:
     """聚合结果数据结构"""
@@ -47,6 +159,35 @@ class ResultAggregator:
             "推进", "发展", "建设", "完善", "提升", "增长", "实现", "达到"
         ]
         
+        # 目标关键词自动机（统计目标类型时每个目标只需扫描一次）
+        self._kw_automaton = ahocorasick.Automaton()
+        for keyword in self.target_keywords:
+            self._kw_automaton.add_word(keyword, keyword)
+        self._kw_automaton.make_automaton()
+        
+        # 目标关键词合并为单一正则（只判断是否包含任一关键词时使用）
+        self._kw_any_re = re.compile("|".join(map(re.escape, self.target_keywords)))
+        
+        # 省份多模式匹配自动机（标准名称 + 别名），每行只需线性扫描一次
+        self._prov_automaton = ahocorasick.Automaton()
+        for province in _PROV_LIST:
+            self._prov_automaton.add_word(province, ("full", province))
+        for alias, full_name in self.province_aliases.items():
+            if alias not in self._prov_automaton:
+                self._prov_automaton.add_word(alias, ("alias", full_name))
+        self._prov_automaton.make_automaton()
+        
+        # 输出格式 -> 格式化方法
+        self._formatters = {
+            "province_list": self._format_as_province_list,
+            "detailed": self._format_as_detailed_report,
+            "comparison": self._format_as_comparison_table,
+            "statistics": self._format_as_statistics,
+        }
+        
+        # 省份名称标准化结果缓存（各批次中重复出现的省份名只需计算一次）
+        self._normalize_province_name = lru_cache(maxsize=2048)(self._normalize_province_name)
+        
         logger.info("📊 结果聚合器初始化完成")
     
     def aggregate_batch_results(self, batch_results: List[Dict[str, Any]], 
@@ -77,44 +218,35 @@ class ResultAggregator:
         
         # 解析和标准化省份信息
         all_provinces = set()
-        province_contents = {}
+        province_contents = defaultdict(list)
         
         for result in successful_results:
-            content = result.get("content", "")
-            provinces = result.get("provinces", [])
-            
             # 解析内容中的省份信息
-            parsed_info = self._parse_province_content(content)
+            parsed_info = self._parse_province_content(result.get("content", ""))
             
             for province, targets in parsed_info.items():
                 normalized_province = self._normalize_province_name(province)
                 if normalized_province:
                     all_provinces.add(normalized_province)
-                    
-                    if normalized_province not in province_contents:
-                        province_contents[normalized_province] = []
-                    
                     province_contents[normalized_province].extend(targets)
         
-        # 去重和优化内容
+        province_contents = dict(province_contents)
+        
+        # 去重和优化内容（同时累计目标总数）
+        total_targets = 0
         for province in province_contents:
             province_contents[province] = self._deduplicate_targets(province_contents[province])
+            total_targets += len(province_contents[province])
         
-        # 根据格式要求生成最终结果
-        if output_format == "province_list":
-            final_content = self._format_as_province_list(province_contents)
-        elif output_format == "detailed":
-            final_content = self._format_as_detailed_report(province_contents)
-        elif output_format == "comparison":
-            final_content = self._format_as_comparison_table(province_contents)
-        elif output_format == "statistics":
-            final_content = self._format_as_statistics(province_contents)
-        else:
-            final_content = self._format_as_province_list(province_contents)
+        # 省份排序只计算一次，供各格式化方法共用
+        sorted_provinces = sorted(province_contents)
+        format_args = (province_contents, sorted_provinces, total_targets)
         
-        # 统计信息
-        total_targets = sum(len(targets) for targets in province_contents.values())
+        # 根据格式要求生成最终结果（未知格式回退到省份列表）
+        formatter = self._formatters.get(output_format, self._format_as_province_list)
+        final_content = formatter(*format_args)
         
+        # 统计信息
         processing_stats = {
             "success_rate": len(successful_results) / len(batch_results),
             "total_batches": len(batch_results),
@@ -143,100 +275,101 @@ class ResultAggregator:
         Returns:
             Dict[str, List[str]]: 省份到目标列表的映射
         """
-        province_info = {}
-        
-        # 按行分割内容
-        lines = content.split('\n')
+        province_info = defaultdict(list)
         current_province = None
         
-        for line in lines:
+        # 单遍扫描：每行只运行一次省份自动机，按切片移除省份前缀后直接拆分目标
+        for line in content.splitlines():
             line = line.strip()
             if not line:
                 continue
             
             # 检查是否是省份标题行
-            province_match = self._extract_province_from_line(line)
+            province_match, prefix_end = self._match_province(line)
             if province_match:
                 current_province = province_match
-                if current_province not in province_info:
-                    province_info[current_province] = []
-                
-                # 提取同行的目标信息
-                targets_in_line = self._extract_targets_from_line(line)
-                if targets_in_line:
-                    province_info[current_province].extend(targets_in_line)
+            elif not current_province:
+                continue
             
-            elif current_province:
-                # 当前行属于某个省份的内容
-                targets_in_line = self._extract_targets_from_line(line)
-                if targets_in_line:
-                    province_info[current_province].extend(targets_in_line)
+            # 提取该行的目标信息（省份标题行或属于当前省份的内容行）
+            province_info[current_province].extend(self._split_targets(line[prefix_end:]))
         
-        return province_info
+        return dict(province_info)
     
-    def _extract_province_from_line(self, line: str) -> str:
-        """从行中提取省份名称"""
-        from config.config import PROVINCES
-        
-        # 检查标准省份名称
-        for province in PROVINCES:
-            if province in line:
-                return province
+    def _match_province(self, line: str) -> Tuple[str, int]:
+        """
+        匹配行中的省份，并给出行首省份前缀的结束位置
         
-        # 检查省份别名
-        for alias, full_name in self.province_aliases.items():
-            if alias in line:
-                return full_name
+        Args:
+            line: 文本行
+            
+        Returns:
+            Tuple[str, int]: (省份名称或None, 行首省份前缀及冒号之后的位置)
+        """
+        # 检查标准省份名称和省份别名（标准名称优先）
+        alias_match = None
+        for end, (kind, name) in self._prov_automaton.iter(line):
+            if kind == "full":
+                prefix_end = 0
+                if end + 1 == len(name):
+                    # 行首即为省份名称，连同一个冒号一起移除
+                    prefix_end = end + 1
+                    if line[prefix_end:prefix_end + 1] in ('：', ':'):
+                        prefix_end += 1
+                return name, prefix_end
+            if alias_match is None:
+                alias_match = name
+        
+        if alias_match:
+            return alias_match, 0
         
         # 使用正则表达式匹配省份模式
-        province_pattern = r'([^：:]+)(?:省|市|自治区)?[：:]'
-        match = re.search(province_pattern, line)
+        match = _PROVINCE_PATTERN.search(line)
         if match:
             potential_province = match.group(1).strip()
             # 验证是否是有效的省份名称
-            for province in PROVINCES:
+            for province in _PROV_LIST:
                 if province in potential_province or potential_province in province:
-                    return province
+                    return province, 0
         
-        return None
+        return None, 0
+    
+    def _extract_province_from_line(self, line: str) -> str:
+        """从行中提取省份名称"""
+        return self._match_province(line)[0]
+    
+    def _contains_province(self, line: str) -> bool:
+        """检查行中是否包含标准省份名称"""
+        return any(kind == "full" for _, (kind, _) in self._prov_automaton.iter(line))
     
     def _extract_targets_from_line(self, line: str) -> List[str]:
         """从行中提取目标信息"""
-        targets = []
-        
-        # 移除省份名称前缀
-        clean_line = line
-        for province in ["北京", "天津", "河北", "山西", "内蒙古", "辽宁", "吉林", "黑龙江",
-                        "上海", "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南",
-                        "湖北", "湖南", "广东", "广西", "海南", "重庆", "四川", "贵州",
-                        "云南", "西藏", "陕西", "甘肃", "青海", "宁夏", "新疆"]:
-            clean_line = re.sub(f'^{province}[：:]?', '', clean_line)
-        
-        # 按分隔符分割目标
-        separators = ['、', '，', ',', '；', ';', '。', '|']
-        
-        for sep in separators:
-            if sep in clean_line:
-                parts = clean_line.split(sep)
-                for part in parts:
-                    part = part.strip()
-                    if part and len(part) > 3:  # 过滤太短的内容
-                        targets.append(part)
-                break
-        else:
-            # 没有找到分隔符，整行作为一个目标
-            clean_line = clean_line.strip()
-            if clean_line and len(clean_line) > 3:
-                targets.append(clean_line)
-        
-        # 过滤和清理目标
+        # 移除省份名称前缀（锚定行首的预编译正则，匹配后直接切片）
+        match = _PROV_PREFIX_RE.match(line)
+        return self._split_targets(line[match.end():] if match else line)
+    
+    def _split_targets(self, clean_line: str) -> List[str]:
+        """从已移除省份前缀的文本中拆分并清理目标（拆分、去序号、过滤在同一循环内完成）"""
         cleaned_targets = []
-        for target in targets:
-            target = re.sub(r'^[0-9]+\.?\s*', '', target)  # 移除序号
+        kw_search = self._kw_any_re.search
+        
+        # 按分隔符分割目标（所有分隔符统一替换后一次分割，无分隔符时整行作为一个目标）
+        for target in clean_line.translate(_SEP_TRANS).split('\x1f'):
             target = target.strip()
+            if len(target) <= 3:  # 过滤太短的内容
+                continue
+            
+            # 移除序号（数字 + 可选的点 + 空白），仅在以数字开头时扫描
+            if '0' <= target[0] <= '9':
+                i, n = 1, len(target)
+                while i < n and '0' <= target[i] <= '9':
+                    i += 1
+                if i < n and target[i] == '.':
+                    i += 1
+                target = target[i:].strip()
             
             # 检查是否包含目标关键词
-            if any(keyword in target for keyword in self.target_keywords) or len(target) > 10:
+            if len(target) > 10 or kw_search(target) is not None:
                 cleaned_targets.append(target)
         
         return cleaned_targets
@@ -247,16 +380,22 @@ class ResultAggregator:
             return None
         
         # 移除常见后缀
-        province = re.sub(r'(省|市|自治区|特别行政区)$', '', province)
+        if province.endswith(_PROVINCE_SUFFIXES):
+            for suffix in _PROVINCE_SUFFIXES:
+                if province.endswith(suffix):
+                    province = province[:-len(suffix)]
+                    break
         
         # 检查别名映射
         if province in self.province_aliases:
             return self.province_aliases[province]
         
         # 检查是否是标准省份名称
-        from config.config import PROVINCES
-        for std_province in PROVINCES:
-            if province == std_province or province in std_province:
+        if province in _PROV_SET:
+            return province
+        
+        for std_province in _PROV_LIST:
+            if province in std_province:
                 return std_province
         
         return province
@@ -269,108 +408,159 @@ class ResultAggregator:
         # 去除完全重复的项
         unique_targets = list(dict.fromkeys(targets))
         
-        # 去除高度相似的项
-        final_targets = []
-        for target in unique_targets:
+        # 每个目标的n-gram签名只计算一次
+        signatures = {target: _ngram_sig(target) for target in unique_targets}
+        
+        # 目标很多时用Numba一次性算出所有相似对
+        similar_pairs = None
+        if numba is not None and len(unique_targets) > _NUMBA_MIN_TARGETS:
+            similar_pairs = self._compute_similar_pairs(
+                [signatures[target] for target in unique_targets], 0.8
+            )
+        
+        # 去除高度相似的项（按稳定编号原位替换，避免list.remove的线性扫描）
+        final_map: Dict[int, str] = {}
+        final_index: Dict[int, int] = {}  # 编号 -> 目标在unique_targets中的下标
+        for index, target in enumerate(unique_targets):
             is_duplicate = False
-            for existing in final_targets:
+            for matched_id in final_map:
+                existing = final_map[matched_id]
+                
                 # 计算相似度
-                if self._calculate_similarity(target, existing) > 0.8:
+                if similar_pairs is not None:
+                    is_similar = similar_pairs[index, final_index[matched_id]]
+                else:
+                    # 签名大小之比低于0.8时相似度不可能超过0.8，直接跳过（整数比较）
+                    size_t = len(signatures[target])
+                    size_e = len(signatures[existing])
+                    if size_t * 5 < size_e * 4 or size_e * 5 < size_t * 4:
+                        continue
+                    
+                    is_similar = self._calculate_similarity(
+                        target, existing, signatures[target], signatures[existing]
+                    ) > 0.8
+                if is_similar:
                     is_duplicate = True
                     # 保留更长的版本
                     if len(target) > len(existing):
-                        final_targets.remove(existing)
-                        final_targets.append(target)
+                        final_map[matched_id] = target
+                        final_index[matched_id] = index
                     break
             
             if not is_duplicate:
-                final_targets.append(target)
+                new_id = len(final_map)
+                final_map[new_id] = target
+                final_index[new_id] = index
+        
+        return list(final_map.values())
+    
+    def _compute_similar_pairs(self, signatures: List[frozenset],
+                               threshold: float) -> np.ndarray:
+        """
+        用Numba内核批量计算签名两两相似关系
         
-        return final_targets
+        Args:
+            signatures: n-gram签名列表
+            threshold: 相似度阈值
+            
+        Returns:
+            np.ndarray: 布尔矩阵，[i, j]（j < i）表示第i与第j个签名相似
+        """
+        sizes = np.fromiter((len(sig) for sig in signatures), dtype=np.int64,
+                            count=len(signatures))
+        offsets = np.zeros(len(signatures) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        hashes = np.fromiter((h for sig in signatures for h in sorted(sig)), dtype=np.int64,
+                             count=int(offsets[-1]))
+        
+        out = np.zeros((len(signatures), len(signatures)), dtype=np.bool_)
+        _similar_pairs_kernel(hashes, offsets, threshold, out)
+        return out
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
+    def _calculate_similarity(self, text1: str, text2: str,
+                              sig1: frozenset = None, sig2: frozenset = None) -> float:
         """计算两个文本的相似度"""
-        # 简单的字符级相似度计算
+        # 基于字符3-gram签名的相似度计算
         if not text1 or not text2:
             return 0.0
         
-        # 计算公共字符数
-        common_chars = sum(1 for c in text1 if c in text2)
-        max_length = max(len(text1), len(text2))
+        if sig1 is None:
+            sig1 = _ngram_sig(text1)
+        if sig2 is None:
+            sig2 = _ngram_sig(text2)
         
-        return common_chars / max_length if max_length > 0 else 0.0
+        return len(sig1 & sig2) / max(len(sig1), len(sig2))
     
-    def _format_as_province_list(self, province_contents: Dict[str, List[str]]) -> str:
+    def _format_as_province_list(self, province_contents: Dict[str, List[str]],
+                                 sorted_provinces: List[str], total_targets: int) -> str:
         """格式化为省份列表格式"""
-        lines = []
-        
-        for province in sorted(province_contents.keys()):
-            targets = province_contents[province]
-            if targets:
-                targets_str = "、".join(targets[:5])  # 限制每个省份最多5个目标
-                if len(targets) > 5:
-                    targets_str += f"等{len(targets)}项"
-                lines.append(f"{province}：{targets_str}")
-            else:
-                lines.append(f"{province}：信息不足")
+        def gen():
+            for province in sorted_provinces:
+                targets = province_contents[province]
+                if targets:
+                    targets_str = "、".join(targets[:5])  # 限制每个省份最多5个目标
+                    if len(targets) > 5:
+                        targets_str += f"等{len(targets)}项"
+                    yield f"{province}：{targets_str}"
+                else:
+                    yield f"{province}：信息不足"
         
-        return "\n".join(lines)
+        return "\n".join(gen())
     
-    def _format_as_detailed_report(self, province_contents: Dict[str, List[str]]) -> str:
+    def _format_as_detailed_report(self, province_contents: Dict[str, List[str]],
+                                   sorted_provinces: List[str], total_targets: int) -> str:
         """格式化为详细报告格式"""
-        sections = []
-        
-        sections.append("# 各省政府工作报告主要目标汇总\n")
-        
-        for province in sorted(province_contents.keys()):
-            targets = province_contents[province]
-            sections.append(f"## {province}")
-            
-            if targets:
-                for i, target in enumerate(targets, 1):
-                    sections.append(f"{i}. {target}")
-            else:
-                sections.append("暂无具体目标信息")
+        def gen():
+            yield "# 各省政府工作报告主要目标汇总\n"
             
-            sections.append("")  # 空行分隔
+            for province in sorted_provinces:
+                targets = province_contents[province]
+                yield f"## {province}"
+                
+                if targets:
+                    yield from (f"{i}. {target}" for i, target in enumerate(targets, 1))
+                else:
+                    yield "暂无具体目标信息"
+                
+                yield ""  # 空行分隔
         
-        return "\n".join(sections)
+        return "\n".join(gen())
     
-    def _format_as_comparison_table(self, province_contents: Dict[str, List[str]]) -> str:
+    def _format_as_comparison_table(self, province_contents: Dict[str, List[str]],
+                                    sorted_provinces: List[str], total_targets: int) -> str:
         """格式化为对比表格格式"""
-        lines = []
-        lines.append("| 省份 | 主要工作目标 | 目标数量 |")
-        lines.append("|------|-------------|---------|")
-        
-        for province in sorted(province_contents.keys()):
-            targets = province_contents[province]
-            target_count = len(targets)
-            
-            if targets:
-                main_targets = "、".join(targets[:3])
-                if len(targets) > 3:
-                    main_targets += "..."
-            else:
-                main_targets = "信息不足"
-                target_count = 0
+        def gen():
+            yield "| 省份 | 主要工作目标 | 目标数量 |"
+            yield "|------|-------------|---------|"
             
-            lines.append(f"| {province} | {main_targets} | {target_count} |")
+            for province in sorted_provinces:
+                targets = province_contents[province]
+                target_count = len(targets)
+                
+                if targets:
+                    main_targets = "、".join(targets[:3])
+                    if len(targets) > 3:
+                        main_targets += "..."
+                else:
+                    main_targets = "信息不足"
+                    target_count = 0
+                
+                yield f"| {province} | {main_targets} | {target_count} |"
         
-        return "\n".join(lines)
+        return "\n".join(gen())
     
-    def _format_as_statistics(self, province_contents: Dict[str, List[str]]) -> str:
+    def _format_as_statistics(self, province_contents: Dict[str, List[str]],
+                              sorted_provinces: List[str], total_targets: int) -> str:
         """格式化为统计信息格式"""
         total_provinces = len(province_contents)
-        total_targets = sum(len(targets) for targets in province_contents.values())
         provinces_with_targets = sum(1 for targets in province_contents.values() if targets)
         
-        # 目标类型统计
-        target_types = {}
+        # 目标类型统计（每个目标中的关键词只计一次）
+        target_types = Counter()
         for targets in province_contents.values():
             for target in targets:
-                for keyword in self.target_keywords:
-                    if keyword in target:
-                        target_types[keyword] = target_types.get(keyword, 0) + 1
+                for keyword in dict.fromkeys(kw for _, kw in self._kw_automaton.iter(target)):
+                    target_types[keyword] += 1
         
         lines = []
         lines.append("# 政府工作报告统计分析")
@@ -396,40 +586,47 @@ class ResultAggregator:
         
         Args:
             content: 原始内容
-            max_tokens: 最大token数（粗略估算）
+            max_tokens: 最大token数（有tiktoken时精确计数，否则粗略估算）
             
         Returns:
             str: 优化后的内容
         """
-        # 粗略估算：1个token约等于1.5个中文字符
-        max_chars = max_tokens * 1.5
-        
-        if len(content) <= max_chars:
-            return content
+        enc = _get_token_encoder()
+        if enc is not None:
+            # 精确计数：一次C层编码
+            if len(enc.encode(content)) <= max_tokens:
+                return content
+            budget = max_tokens
+            measure = lambda text: len(enc.encode(text))
+            truncate = lambda text, n: enc.decode(enc.encode(text)[:n]).rstrip('\ufffd')
+            unit = "token"
+        else:
+            # 粗略估算：1个token约等于1.5个中文字符
+            budget = int(max_tokens * 1.5)
+            if len(content) <= budget:
+                return content
+            measure = len
+            truncate = lambda text, n: text[:n]
+            unit = "字符"
         
-        logger.info(f"🔧 优化内容长度: {len(content)} -> {max_chars} 字符")
+        logger.info(f"🔧 优化内容长度: 超出 {budget} {unit}的限制")
         
         # 按行分割并保留重要信息
-        lines = content.split('\n')
         optimized_lines = []
-        current_chars = 0
+        used = 0
         
         # 优先保留省份标题行
-        for line in lines:
-            if any(province in line for province in ["北京", "天津", "河北", "山西", "内蒙古", 
-                                                   "辽宁", "吉林", "黑龙江", "上海", "江苏", 
-                                                   "浙江", "安徽", "福建", "江西", "山东", 
-                                                   "河南", "湖北", "湖南", "广东", "广西", 
-                                                   "海南", "重庆", "四川", "贵州", "云南", 
-                                                   "西藏", "陕西", "甘肃", "青海", "宁夏", "新疆"]):
-                if current_chars + len(line) <= max_chars:
+        for line in content.splitlines():
+            if self._contains_province(line):
+                line_size = measure(line)
+                if used + line_size <= budget:
                     optimized_lines.append(line)
-                    current_chars += len(line) + 1  # +1 for newline
+                    used += line_size + 1  # +1 for newline
                 else:
-                    # 截断最后一行
-                    remaining_chars = max_chars - current_chars
-                    if remaining_chars > 10:
-                        optimized_lines.append(line[:remaining_chars] + "...")
+                    # 截断最后一行后立即结束
+                    remaining = budget - used
+                    if remaining > 10:
+                        optimized_lines.append(truncate(line, remaining - 3) + "...")
                     break
         
         return '\n'.join(optimized_lines)
@@ -5,11 +5,18 @@ RAG检索引擎
 负责智能检索、结果排序和上下文构建
 """
 
-import re
+from collections import OrderedDict, defaultdict
+from itertools import chain
+from operator import attrgetter
 from typing import List, Dict, Tuple, Optional, Set
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 import logging
 
+import ahocorasick
+import numpy as np
+
+from config.config import PROVINCES, RETRIEVAL_CONFIG
 from data_processor import DocumentChunk
 from vector_store import get_vector_store
 from api_client import get_api_client
@@ -18,14 +25,66 @@ from api_client import get_api_client
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+# 智能检索结果缓存的最大条目数
+_RETRIEVE_CACHE_SIZE = 256
+
+# 文档块排序键（DocumentChunk.chunk_id 字段有默认值，旧索引中的块同样可用）
+_CHUNK_ID_KEY = attrgetter('chunk_id')
+
+# 主题类别（按输出顺序）
+_TOPIC_CATEGORIES = ("targets", "economic", "social", "environment")
+
+@dataclass(slots=True)
 class RetrievalResult:
     """检索结果数据结构"""
     chunks: List[DocumentChunk]
     provinces: Set[str]
-    total_chars: int
     query_type: str
     retrieval_strategy: str
+    _total_chars: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def total_chars(self) -> int:
+        """总字符数（首次访问时计算一次）"""
+        if self._total_chars is None:
+            self._total_chars = sum(chunk.char_count for chunk in self.chunks)
+        return self._total_chars
+
+class _TruncatedChunk:
+    """截断后的文档块视图：只覆盖与内容相关的字段，其余属性委托给原始块"""
+    __slots__ = ('_orig', 'id', 'content', 'char_count', 'end_pos')
+    
+    def __init__(self, orig: DocumentChunk, content: str):
+        self._orig = orig
+        self.id = orig.id + "_truncated"
+        self.content = content
+        self.char_count = len(content)
+        self.end_pos = orig.start_pos + len(content)
+    
+    def __getattr__(self, name):
+        if name == '_orig':  # 未初始化（如复制/反序列化过程中）时避免无限递归
+            raise AttributeError(name)
+        return getattr(self._orig, name)
+    
+    @property
+    def word_count(self) -> int:
+        return len(self.content.split())
+    
+    def to_dict(self) -> Dict:
+        """转换为字典格式"""
+        data = self._orig.to_dict()
+        data.update(id=self.id, content=self.content, char_count=self.char_count,
+                    end_pos=self.end_pos, word_count=self.word_count)
+        return data
+
+@lru_cache(maxsize=4096)
+def _clean_content(content: str) -> str:
+    """
+    简化内容，移除多余的换行和空格（与 re.sub(r'\\s+', ' ', content.strip()) 等价，全程在C层完成）
+    
+    按内容缓存：热门块在多次检索结果中重复出现时只需处理一次。
+    """
+    return ' '.join(content.split())
 
 class RAGRetriever:
     """RAG检索引擎"""
@@ -52,9 +111,40 @@ class RAGRetriever:
         }
         
         # 省份名称列表（用于意图识别）
-        from config.config import PROVINCES, RETRIEVAL_CONFIG
         self.provinces = PROVINCES
+        self._provinces_set = frozenset(PROVINCES)  # 成员判断
+        self._provinces_tuple = tuple(PROVINCES)  # 按配置顺序遍历
         self.config = RETRIEVAL_CONFIG
+        # HNSW索引的搜索宽度（旧配置文件中没有该项时使用索引默认值）
+        self._ef_search = RETRIEVAL_CONFIG.get("ef_search")
+        # 是否用8位量化索引做候选检索（FP32重排）
+        self._quantized_search = RETRIEVAL_CONFIG.get("quantized_search", False)
+        
+        # 意图关键词 + 省份名称的多模式匹配自动机，查询只需线性扫描一次
+        patterns = defaultdict(list)
+        for category, keywords in self.intent_keywords.items():
+            for keyword in keywords:
+                patterns[keyword].append(category)
+        for province in self.provinces:
+            patterns[province].append("province")
+        self._intent_automaton = ahocorasick.Automaton()
+        for word, categories in patterns.items():
+            self._intent_automaton.add_word(word, (tuple(categories), word))
+        self._intent_automaton.make_automaton()
+        
+        # 查询意图缓存（意图只取决于查询文本和固定的关键词表）
+        self._intent_cached = lru_cache(maxsize=512)(self._compute_intent)
+        
+        # 智能检索结果的LRU缓存：(意图, 规范化查询, 字符上限) -> RetrievalResult，
+        # 向量存储重新加载或重建（版本号变化）后整体清空
+        self._retrieve_cache: "OrderedDict[tuple, RetrievalResult]" = OrderedDict()
+        self._retrieve_cache_generation = self.vector_store.generation
+        
+        # 同一文档（来源+省份）的块索引，首次获取相邻块时构建
+        self._doc_index: Dict[Tuple[str, str], List[DocumentChunk]] = {}
+        self._chunk_position: Dict[Tuple[str, str, int, str], int] = {}
+        self._indexed_chunks = None
+        self._indexed_count = 0
         
         logger.info("🔍 RAG检索引擎初始化完成")
     
@@ -70,36 +160,22 @@ class RAGRetriever:
             List[DocumentChunk]: 相邻块列表（不包含原始块）
         """
         try:
-            # 获取同一文档的所有块
-            same_doc_chunks = []
-            for stored_chunk in self.vector_store.chunks:
-                if (stored_chunk.source == chunk.source and 
-                    stored_chunk.province == chunk.province):
-                    same_doc_chunks.append(stored_chunk)
-            
-            # 按chunk_id排序
-            same_doc_chunks.sort(key=lambda x: getattr(x, 'chunk_id', 0))
+            # 获取同一文档的所有块（已按chunk_id排序）
+            self._ensure_doc_index()
+            same_doc_chunks = self._doc_index.get((chunk.source, chunk.province), [])
             
             # 找到目标块的位置
-            target_index = -1
-            for i, stored_chunk in enumerate(same_doc_chunks):
-                if (stored_chunk.content == chunk.content and 
-                    stored_chunk.start_pos == chunk.start_pos):
-                    target_index = i
-                    break
+            target_index = self._chunk_position.get(
+                (chunk.source, chunk.province, chunk.start_pos, chunk.content), -1
+            )
             
             if target_index == -1:
                 logger.warning(f"⚠️ 未找到目标块的位置")
                 return []
             
-            # 获取相邻块
-            adjacent_chunks = []
-            start_idx = max(0, target_index - window)
-            end_idx = min(len(same_doc_chunks), target_index + window + 1)
-            
-            for i in range(start_idx, end_idx):
-                if i != target_index:  # 排除原始块
-                    adjacent_chunks.append(same_doc_chunks[i])
+            # 获取相邻块（排除原始块）
+            adjacent_chunks = (same_doc_chunks[max(0, target_index - window):target_index] +
+                               same_doc_chunks[target_index + 1:target_index + 1 + window])
             
             logger.debug(f"🔗 获取到 {len(adjacent_chunks)} 个相邻块")
             return adjacent_chunks
@@ -108,6 +184,30 @@ class RAGRetriever:
             logger.warning(f"⚠️ 获取相邻块失败: {str(e)}")
             return []
     
+    def _ensure_doc_index(self):
+        """构建（或在向量存储的块列表变化后重建）文档块索引"""
+        chunks = self.vector_store.chunks
+        if chunks is self._indexed_chunks and len(chunks) == self._indexed_count:
+            return
+        
+        doc_index = defaultdict(list)
+        for stored_chunk in chunks:
+            doc_index[(stored_chunk.source, stored_chunk.province)].append(stored_chunk)
+        
+        chunk_position = {}
+        for (source, province), doc_chunks in doc_index.items():
+            # 按chunk_id排序
+            doc_chunks.sort(key=_CHUNK_ID_KEY)
+            for i, stored_chunk in enumerate(doc_chunks):
+                # 内容与起始位置相同的块以第一个为准
+                chunk_position.setdefault((source, province, stored_chunk.start_pos, stored_chunk.content), i)
+        
+        self._doc_index = dict(doc_index)
+        self._chunk_position = chunk_position
+        self._indexed_chunks = chunks
+        self._indexed_count = len(chunks)
+        logger.debug(f"🗂️ 文档块索引构建完成: {len(doc_index)} 个文档")
+    
     def identify_query_intent(self, query: str) -> Dict[str, any]:
         """
         识别查询意图
@@ -118,60 +218,60 @@ class RAGRetriever:
         Returns:
             Dict: 查询意图信息
         """
+        # 关键词都不含空白，合并空白后的查询意图不变，可作为缓存键
+        intent_type, provinces, topics, scope = self._intent_cached(" ".join(query.split()))
+        
         intent = {
-            "type": "general",
-            "provinces": [],
-            "topics": [],
-            "scope": "general"
+            "type": intent_type,
+            "provinces": list(provinces),
+            "topics": list(topics),
+            "scope": scope
         }
         
-        query_lower = query.lower()
+        logger.debug(f"🎯 查询意图: {intent}")
+        return intent
+    
+    def _compute_intent(self, query: str) -> Tuple[str, Tuple[str, ...], Tuple[str, ...], str]:
+        """计算查询意图（纯函数，结果由identify_query_intent缓存）"""
+        intent_type = "general"
+        scope = "general"
+        
+        # 一次扫描收集命中的意图类别和省份
+        hit_categories = set()
+        hit_provinces = set()
+        for _, (categories, word) in self._intent_automaton.iter(query):
+            for category in categories:
+                if category == "province":
+                    hit_provinces.add(word)
+                else:
+                    hit_categories.add(category)
         
         # 检查是否查询所有省份
-        for keyword in self.intent_keywords["all_provinces"]:
-            if keyword in query:
-                intent["type"] = "all_provinces"
-                intent["scope"] = "comprehensive"
-                break
-        
-        # 检查特定省份
-        mentioned_provinces = []
-        for province in self.provinces:
-            if province in query:
-                mentioned_provinces.append(province)
+        if "all_provinces" in hit_categories:
+            intent_type = "all_provinces"
+            scope = "comprehensive"
+        
+        # 检查特定省份（保持省份列表顺序）
+        mentioned_provinces = tuple(province for province in self._provinces_tuple if province in hit_provinces)
         
         if mentioned_provinces:
-            intent["provinces"] = mentioned_provinces
             if len(mentioned_provinces) == 1:
-                intent["type"] = "single_province"
+                intent_type = "single_province"
             else:
-                intent["type"] = "multi_province"
+                intent_type = "multi_province"
         
         # 检查对比意图
-        for keyword in self.intent_keywords["comparison"]:
-            if keyword in query:
-                intent["type"] = "comparison"
-                break
+        if "comparison" in hit_categories:
+            intent_type = "comparison"
         
         # 检查统计意图
-        for keyword in self.intent_keywords["statistics"]:
-            if keyword in query:
-                intent["type"] = "statistics"
-                break
+        if "statistics" in hit_categories:
+            intent_type = "statistics"
         
         # 识别主题
-        topics = []
-        for topic, keywords in self.intent_keywords.items():
-            if topic in ["targets", "economic", "social", "environment"]:
-                for keyword in keywords:
-                    if keyword in query:
-                        topics.append(topic)
-                        break
-        
-        intent["topics"] = topics
+        topics = tuple(topic for topic in _TOPIC_CATEGORIES if topic in hit_categories)
         
-        logger.debug(f"🎯 查询意图: {intent}")
-        return intent
+        return intent_type, mentioned_provinces, topics, scope
     
     def retrieve_for_all_provinces(self, query: str, top_k_per_province: int = None) -> RetrievalResult:
         """
@@ -192,27 +292,27 @@ class RAGRetriever:
         all_chunks = []
         provinces_found = set()
         
-        # 为每个省份单独检索
-        for province in self.provinces:
-            province_chunks = self.vector_store.search(
-                query, 
-                top_k=top_k_per_province * 4,  # 从3倍增加到4倍，搜索更多结果用于过滤
-                province_filter=province
-            )
-            
+        # 一次检索后按省份分桶（候选窗口与逐省检索 top_k_per_province * 4 时相同）
+        grouped = self.vector_store.search_grouped_by_province(
+            query,
+            self._provinces_tuple,
+            top_k_per_province,
+            candidate_top_k=top_k_per_province * 4,  # 从3倍增加到4倍，搜索更多结果用于过滤
+            ef_search=self._ef_search,
+            quantized=self._quantized_search
+        )
+        
+        for province in self._provinces_tuple:
             # 取前N个结果
-            for chunk, score in province_chunks[:top_k_per_province]:
+            for chunk, score in grouped[province]:
                 all_chunks.append(chunk)
                 provinces_found.add(province)
         
-        total_chars = sum(chunk.char_count for chunk in all_chunks)
-        
         logger.info(f"✅ 检索完成: {len(provinces_found)} 个省份, {len(all_chunks)} 个块")
         
         return RetrievalResult(
             chunks=all_chunks,
             provinces=provinces_found,
-            total_chars=total_chars,
             query_type="all_provinces",
             retrieval_strategy="province_based"
         )
@@ -242,27 +342,30 @@ class RAGRetriever:
         all_chunks = []
         provinces_found = set()
         
+        known_provinces = []
         for province in provinces:
-            if province not in self.provinces:
+            if province not in self._provinces_set:
                 logger.warning(f"⚠️ 未知省份: {province}")
                 continue
-            
-            province_chunks = self.vector_store.search(
-                query,
-                top_k=top_k_per_province * 3,  # 从2倍增加到3倍
-                province_filter=province
-            )
-            
-            for chunk, score in province_chunks[:top_k_per_province]:
+            known_provinces.append(province)
+        
+        grouped = self.vector_store.search_grouped_by_province(
+            query,
+            known_provinces,
+            top_k_per_province,
+            candidate_top_k=top_k_per_province * 3,  # 从2倍增加到3倍
+            ef_search=self._ef_search,
+            quantized=self._quantized_search
+        ) if known_provinces else {}
+        
+        for province in known_provinces:
+            for chunk, score in grouped[province]:
                 all_chunks.append(chunk)
                 provinces_found.add(province)
         
-        total_chars = sum(chunk.char_count for chunk in all_chunks)
-        
         return RetrievalResult(
             chunks=all_chunks,
             provinces=provinces_found,
-            total_chars=total_chars,
             query_type="specific_provinces",
             retrieval_strategy="targeted"
         )
@@ -292,29 +395,30 @@ class RAGRetriever:
             all_chunks = []
             provinces_found = set()
             
+            grouped = self.vector_store.search_grouped_by_province(
+                query,
+                provinces,
+                top_k_per_province,
+                candidate_top_k=top_k_per_province * 3,  # 从2倍增加到3倍，搜索更多用于筛选
+                ef_search=self._ef_search,
+                quantized=self._quantized_search
+            )
+            
             for province in provinces:
-                province_chunks = self.vector_store.search(
-                    query,
-                    top_k=top_k_per_province * 3,  # 从2倍增加到3倍，搜索更多用于筛选
-                    province_filter=province
-                )
-                
                 # 取前N个结果
-                for chunk, score in province_chunks[:top_k_per_province]:
+                for chunk, score in grouped[province]:
                     all_chunks.append(chunk)
                     provinces_found.add(province)
         else:
             # 全局对比检索
-            search_results = self.vector_store.search(query, top_k=top_k)
+            search_results = self.vector_store.search(query, top_k=top_k, ef_search=self._ef_search,
+                                                      quantized=self._quantized_search)
             all_chunks = [chunk for chunk, score in search_results]
             provinces_found = set(chunk.province for chunk in all_chunks)
         
-        total_chars = sum(chunk.char_count for chunk in all_chunks)
-        
         return RetrievalResult(
             chunks=all_chunks,
             provinces=provinces_found,
-            total_chars=total_chars,
             query_type="comparison",
             retrieval_strategy="comparative"
         )
@@ -340,17 +444,17 @@ class RAGRetriever:
         search_results = self.vector_store.search(
             query,
             top_k=top_k,
-            chunk_type_filter=chunk_type
+            chunk_type_filter=chunk_type,
+            ef_search=self._ef_search,
+            quantized=self._quantized_search
         )
         
         all_chunks = [chunk for chunk, score in search_results]
         provinces_found = set(chunk.province for chunk in all_chunks)
-        total_chars = sum(chunk.char_count for chunk in all_chunks)
         
         return RetrievalResult(
             chunks=all_chunks,
             provinces=provinces_found,
-            total_chars=total_chars,
             query_type="topic",
             retrieval_strategy="topic_based"
         )
@@ -371,6 +475,31 @@ class RAGRetriever:
         # 识别查询意图
         intent = self.identify_query_intent(query)
         
+        # 相同意图 + 相同查询（忽略空白差异）直接复用之前的检索结果；索引加载或重建后清空
+        if self._retrieve_cache_generation != self.vector_store.generation:
+            self._retrieve_cache.clear()
+            self._retrieve_cache_generation = self.vector_store.generation
+        cache_key = (
+            intent["type"], frozenset(intent["provinces"]), frozenset(intent["topics"]),
+            " ".join(query.split()), max_context_chars
+        )
+        cached = self._retrieve_cache.get(cache_key)
+        if cached is not None:
+            self._retrieve_cache.move_to_end(cache_key)
+            logger.info(f"♻️ 命中检索缓存: {len(cached.chunks)} 个块, {len(cached.provinces)} 个省份")
+            return cached
+        
+        result = self._retrieve_by_intent(query, intent, max_context_chars)
+        
+        self._retrieve_cache[cache_key] = result
+        if len(self._retrieve_cache) > _RETRIEVE_CACHE_SIZE:
+            self._retrieve_cache.popitem(last=False)
+        
+        return result
+    
+    def _retrieve_by_intent(self, query: str, intent: Dict[str, any],
+                            max_context_chars: Optional[int]) -> RetrievalResult:
+        """按已识别的查询意图执行检索（smart_retrieve的缓存未命中路径）"""
         # 根据意图选择检索策略和上下文限制
         if intent["type"] == "all_provinces":
             # 查询所有省份
@@ -404,35 +533,33 @@ class RAGRetriever:
         
         else:
             # 通用检索 - 大幅增加检索数量
-            search_results = self.vector_store.search(query, top_k=60)  # 从25增加到60
+            search_results = self.vector_store.search(query, top_k=60,  # 从25增加到60
+                                                      ef_search=self._ef_search,
+                                                      quantized=self._quantized_search)
             primary_chunks = [chunk for chunk, score in search_results]
             
-            # 应用相邻块聚合策略
+            # 应用相邻块聚合策略（原始块和相邻块都是向量存储中的同一批对象，按对象身份去重）
             enhanced_chunks = []
             seen_chunks = set()
             
             for chunk in primary_chunks:
                 # 添加原始块
-                chunk_key = (chunk.source, chunk.start_pos, chunk.content[:50])
-                if chunk_key not in seen_chunks:
+                if id(chunk) not in seen_chunks:
                     enhanced_chunks.append(chunk)
-                    seen_chunks.add(chunk_key)
+                    seen_chunks.add(id(chunk))
                 
                 # 获取相邻块并添加
                 adjacent_chunks = self.get_adjacent_chunks(chunk, window=1)
                 for adj_chunk in adjacent_chunks:
-                    adj_key = (adj_chunk.source, adj_chunk.start_pos, adj_chunk.content[:50])
-                    if adj_key not in seen_chunks:
+                    if id(adj_chunk) not in seen_chunks:
                         enhanced_chunks.append(adj_chunk)
-                        seen_chunks.add(adj_key)
+                        seen_chunks.add(id(adj_chunk))
             
             provinces_found = set(chunk.province for chunk in enhanced_chunks)
-            total_chars = sum(chunk.char_count for chunk in enhanced_chunks)
             
             result = RetrievalResult(
                 chunks=enhanced_chunks,
                 provinces=provinces_found,
-                total_chars=total_chars,
                 query_type="general",
                 retrieval_strategy="semantic_with_adjacent"
             )
@@ -481,45 +608,36 @@ class RAGRetriever:
         else:
             # 改进的截断策略：优先保留信息密度高的块
             # 按字符数与相关性的综合评分排序
-            def chunk_score(chunk):
-                # 综合评分：字符数适中且内容丰富的块得分更高
-                char_score = min(chunk.char_count / 500, 2.0)  # 500字符左右得分最高
-                content_score = len(chunk.content.split()) / 100  # 词数越多得分越高
-                return char_score + content_score
-            
-            sorted_chunks = sorted(result.chunks, key=chunk_score, reverse=True)
-            
-            truncated_chunks = []
-            current_chars = 0
-            
-            for chunk in sorted_chunks:
-                if current_chars + chunk.char_count <= max_chars:
-                    truncated_chunks.append(chunk)
-                    current_chars += chunk.char_count
-                else:
-                    # 如果还有空间，尝试截取部分内容
-                    remaining_chars = max_chars - current_chars
-                    if remaining_chars > 200:  # 至少保留200字符才有意义
-                        truncated_content = chunk.content[:remaining_chars-50] + "..."
-                        truncated_chunk = DocumentChunk(
-                            id=chunk.id + "_truncated",
-                            province=chunk.province,
-                            content=truncated_content,
-                            chunk_type=chunk.chunk_type,
-                            metadata=chunk.metadata,
-                            char_count=len(truncated_content),
-                            source=chunk.source,
-                            start_pos=chunk.start_pos,
-                            end_pos=chunk.start_pos + len(truncated_content),
-                            chunk_id=chunk.chunk_id
-                        )
-                        truncated_chunks.append(truncated_chunk)
-                    break
+            # 综合评分：字符数适中且内容丰富的块得分更高（向量化计算，词数在分块时已缓存）
+            chunks = result.chunks
+            char_counts = np.fromiter((chunk.char_count for chunk in chunks), dtype=np.float64, count=len(chunks))
+            word_counts = np.fromiter((chunk.word_count for chunk in chunks), dtype=np.float64, count=len(chunks))
+            char_score = np.minimum(char_counts / 500, 2.0)  # 500字符左右得分最高
+            content_score = word_counts / 100  # 词数越多得分越高
+            
+            # 稳定排序，同分时保持原有顺序
+            order = np.argsort(-(char_score + content_score), kind="stable")
+            
+            # 按排序累加字符数，二分找到能完整放入的块数
+            cumulative_chars = np.cumsum(char_counts[order])
+            cut = int(np.searchsorted(cumulative_chars, max_chars, side="right"))
+            truncated_chunks = [chunks[i] for i in order[:cut]]
+            
+            if cut < len(chunks):
+                chunk = chunks[order[cut]]
+                current_chars = int(cumulative_chars[cut - 1]) if cut else 0
+                
+                # 如果还有空间，尝试截取部分内容
+                remaining_chars = max_chars - current_chars
+                if remaining_chars > 200:  # 至少保留200字符才有意义
+                    truncated_content = chunk.content[:remaining_chars-50] + "..."
+                    truncated_chunks.append(_TruncatedChunk(chunk, truncated_content))
+        
+        provinces_found = set(chunk.province for chunk in truncated_chunks)
         
         return RetrievalResult(
             chunks=truncated_chunks,
-            provinces=set(chunk.province for chunk in truncated_chunks),
-            total_chars=sum(chunk.char_count for chunk in truncated_chunks),
+            provinces=provinces_found,
             query_type=result.query_type,
             retrieval_strategy=result.retrieval_strategy + "_truncated"
         )
@@ -537,26 +655,16 @@ class RAGRetriever:
         if not result.chunks:
             return "未找到相关信息。"
         
-        context_parts = []
-        
-        # 按省份分组
-        province_chunks = {}
+        # 按省份分组，同时简化内容（每个块只处理一次）
+        province_contents = defaultdict(list)
         for chunk in result.chunks:
-            province = chunk.province
-            if province not in province_chunks:
-                province_chunks[province] = []
-            province_chunks[province].append(chunk)
+            # 简化内容，移除多余的换行和空格
+            province_contents[chunk.province].append(_clean_content(chunk.content))
         
         # 格式化每个省份的信息
-        for province, chunks in province_chunks.items():
-            context_parts.append(f"\n=== {province} ===")
-            
-            for chunk in chunks:
-                # 简化内容，移除多余的换行和空格
-                content = re.sub(r'\s+', ' ', chunk.content.strip())
-                context_parts.append(content)
-        
-        context = "\n".join(context_parts)
+        context = "\n".join(chain.from_iterable(
+            (f"\n=== {province} ===", *contents) for province, contents in province_contents.items()
+        ))
         
         logger.debug(f"📝 上下文格式化完成: {len(context)} 字符")
         
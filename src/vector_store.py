@@ -6,14 +6,29 @@
 """
 
 import os
+import json
 import pickle
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
+from collections import OrderedDict, defaultdict
 import logging
 import faiss
 from tqdm import tqdm
 
+# 可选依赖：GPU上的CAGRA图索引（cuVS）
+try:
+    import cupy as cp
+    from cuvs.neighbors import cagra
+except ImportError:
+    cp = cagra = None
+
+# 可选依赖：用Numba并行计算候选的精确分数（重排）
+try:
+    import numba
+except ImportError:
+    numba = None
+
 from data_processor import DocumentChunk
 from embedding_manager import get_embedding_manager
 
@@ -21,28 +36,159 @@ from embedding_manager import get_embedding_manager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# index_type为"auto"时按向量数量选择索引：少量数据精确检索，中等规模用HNSW图，大规模用IVF倒排+乘积量化
+_HNSW_MIN_VECTORS = 10000
+_IVF_MIN_VECTORS = 1000000
+
+# 批量检索的查询数达到该值时才把平面/IVF索引复制到GPU上检索（单条查询在GPU上反而更慢）
+_GPU_BATCH_MIN_QUERIES = 32
+
+# FAISS GPU检索支持的最大k
+_GPU_MAX_K = 2048
+
+# 构建索引时每次编码并加入索引的批次数（每个窗口batch_size*该值个文档块）
+_BUILD_WINDOW_BATCHES = 16
+
+# 乘积量化每个子空间256个码字（8位），训练向量不能少于码字数
+_PQ_MIN_TRAIN_VECTORS = 256
+
+# 查询向量LRU缓存的最大条目数
+_QUERY_CACHE_SIZE = 1024
+
+# FAISS的OpenMP线程数是进程级设置，只在首个指定了线程数的向量存储创建时设置一次
+_omp_threads_configured = False
+
+# 列式元数据文件中的字段：短字符串列存为定长Unicode数组，整数列存为int64数组，
+# 正文与metadata（JSON）按UTF-8字节拼接成一个缓冲区并记录偏移
+_STR_COLUMNS = ("id", "province", "chunk_type", "source")
+_INT_COLUMNS = ("char_count", "start_pos", "end_pos", "chunk_id", "word_count")
+
+
+def _ensure_f32_contig(array: np.ndarray) -> np.ndarray:
+    """转换为FAISS需要的float32连续数组；已满足时原样返回，不做拷贝"""
+    if isinstance(array, np.ndarray) and array.dtype == np.float32 and array.flags.c_contiguous:
+        return array
+    return np.ascontiguousarray(array, dtype=np.float32)
+
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _rerank_kernel(query, embeddings, candidates, inner_product, out):
+        """
+        并行计算候选向量与查询的精确分数（直接读取embeddings中的行，不先拷贝出候选矩阵）
+        
+        Args:
+            query: 查询向量（float32）
+            embeddings: 全部文档向量（float32，可为内存映射）
+            candidates: 候选行号
+            inner_product: True时计算内积，否则计算L2距离的平方
+            out: 输出分数
+        """
+        dim = query.shape[0]
+        for i in numba.prange(candidates.shape[0]):
+            row = embeddings[candidates[i]]
+            acc = 0.0
+            if inner_product:
+                for j in range(dim):
+                    acc += query[j] * row[j]
+            else:
+                for j in range(dim):
+                    diff = row[j] - query[j]
+                    acc += diff * diff
+            out[i] = acc
+
+
+def _pack_texts(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """把字符串列表打包为 (UTF-8字节缓冲区, 偏移数组)"""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_texts(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """_pack_texts 的逆操作"""
+    data = buffer.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
 class VectorStore:
     """向量存储管理器"""
     
-    def __init__(self, store_path: str, embedding_dim: int = 1024):
+    def __init__(self, store_path: str, embedding_dim: int = 1024, backend: str = "faiss",
+                 index_type: str = "auto", hnsw_m: int = 32, ef_construction: int = 200,
+                 ef_search: int = 64, nprobe: int = 16, mmap: bool = True,
+                 embedding_dtype: str = "float32", omp_threads: Optional[int] = None,
+                 blas_threshold: int = 8, embedding_manager=None):
         """
         初始化向量存储
         
         Args:
             store_path: 存储路径
             embedding_dim: 向量维度
+            backend: 检索后端，"faiss"（CPU）或 "cagra"（cuVS GPU图索引，不可用时回退到faiss）
+            index_type: FAISS索引类型，"flat"、"hnsw"、"ivf"、"ivfpq"、"sq8"、"fp16"、"hnsw_sq" 或 "auto"（按向量数量选择）
+            hnsw_m: HNSW每个节点的邻居数
+            ef_construction: HNSW构建时的搜索宽度
+            ef_search: HNSW检索时的默认搜索宽度（不影响已构建的索引，可随时调整）
+            nprobe: IVF检索时访问的聚类数（可随时调整）
+            mmap: 加载索引时是否以内存映射方式只读打开FAISS索引和embeddings文件（按需分页读入）
+            embedding_dtype: 保存的chunk_embeddings精度，"float32" 或 "float16"（内存和磁盘占用减半）
+            omp_threads: FAISS检索使用的OpenMP线程数（默认不修改FAISS的设置）。与embedding模型在
+                同一进程内运行时，PyTorch有自己的线程池，CPU推理时可适当调小以免两边线程争抢。
+                该设置是进程级的，只在首次指定时生效一次
+            blas_threshold: 一次检索的查询数达到该值时FAISS走BLAS矩阵乘法（FAISS默认20）
+            embedding_manager: embedding管理器实例（可选，默认在首次编码时获取全局实例）
         """
         self.store_path = Path(store_path)
         self.embedding_dim = embedding_dim
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.mmap = mmap
+        self.embedding_dtype = np.dtype(embedding_dtype)
+        self._embedding_manager = embedding_manager
+        
+        # FAISS线程数与BLAS阈值是进程级设置
+        global _omp_threads_configured
+        if omp_threads and not _omp_threads_configured:
+            faiss.omp_set_num_threads(omp_threads)
+            _omp_threads_configured = True
+        faiss.cvar.distance_compute_blas_threshold = blas_threshold
+        
+        if backend == "cagra" and cagra is None:
+            logger.warning("⚠️ 未安装cuVS/CuPy，检索后端回退到faiss")
+            backend = "faiss"
+        self.backend = backend
         
         # FAISS索引
         self.index = None
         self.chunks = []  # 存储文档块信息
         self.chunk_embeddings = None
+        self._q8_index = None  # 8位标量量化的候选检索索引（按需构建）
+        self._cagra_index = None  # GPU上的CAGRA图索引（按需构建）
+        self._gpu_index = None  # 批量检索用的FAISS GPU索引副本（按需构建）
+        self._gpu_resources = None
+        self._chunk_provinces = None  # 各文档块省份的数组，用于批量检索时的向量化过滤
+        self._chunk_types = None  # 各文档块类型的数组
+        self._chunk_char_counts = None  # 各文档块字符数的数组
+        self._metadata_chunks = None  # 上述数组对应的文档块列表
+        self._statistics_cache = None  # 分组统计结果（加载或重建索引时清空）
+        
+        # 存储版本号：加载或重建索引时递增，依赖文档块的外部缓存据此判断是否失效
+        self.generation = 0
+        
+        # 查询向量缓存（查询文本 -> 向量），重复查询无需再次运行embedding模型
+        self._query_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_hits = 0
+        self._query_cache_misses = 0
         
         # 文件路径
         self.index_file = self.store_path / "faiss_index.bin"
-        self.chunks_file = self.store_path / "chunks_metadata.pkl"
+        self.chunks_file = self.store_path / "chunks_metadata.pkl"  # 旧版（及metadata无法JSON序列化时）的pickle格式
+        self.columns_file = self.store_path / "chunks_columns.npz"
         self.embeddings_file = self.store_path / "embeddings.npy"
         
         # 确保目录存在
@@ -51,28 +197,79 @@ class VectorStore:
         logger.info(f"🗄️ 向量存储初始化")
         logger.info(f"📁 存储路径: {self.store_path}")
         logger.info(f"📐 向量维度: {embedding_dim}")
+        logger.info(f"🧵 FAISS线程数: {faiss.omp_get_max_threads()}")
     
-    def _create_faiss_index(self, dimension: int) -> faiss.Index:
+    @property
+    def embedding_manager(self):
+        """embedding管理器（首次使用时获取全局实例并保存，检索时不再重复查找）"""
+        if self._embedding_manager is None:
+            self._embedding_manager = get_embedding_manager(attn_implementation="sdpa")
+        return self._embedding_manager
+    
+    def _create_faiss_index(self, dimension: int, num_vectors: int = 0) -> faiss.Index:
         """
         创建FAISS索引
         
         Args:
             dimension: 向量维度
+            num_vectors: 待索引的向量数量（index_type为"auto"时用于选择索引类型）
             
         Returns:
-            faiss.Index: FAISS索引
+            faiss.Index: FAISS索引（IVF索引需要先训练再添加向量）
+        
+        所有索引都使用内积度量，配合L2归一化后的向量，检索分数即余弦相似度。
         """
-        # 使用L2距离的平面索引（适合中小规模数据）
-        index = faiss.IndexFlatL2(dimension)
+        index_type = self.index_type
+        if index_type == "auto":
+            if num_vectors >= _IVF_MIN_VECTORS:
+                index_type = "ivfpq"
+            elif num_vectors >= _HNSW_MIN_VECTORS:
+                index_type = "hnsw"
+            else:
+                index_type = "flat"
+        
+        if index_type == "ivfpq" and num_vectors < _PQ_MIN_TRAIN_VECTORS:
+            logger.warning(f"⚠️ 向量数量不足{_PQ_MIN_TRAIN_VECTORS}，无法训练乘积量化，改用平面索引")
+            index_type = "flat"
         
-        # 如果数据量大，可以使用IVF索引
-        # nlist = 100  # 聚类中心数量
-        # quantizer = faiss.IndexFlatL2(dimension)
-        # index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        if index_type == "hnsw":
+            # HNSW图索引：检索复杂度近似对数级，无需训练
+            index = faiss.IndexHNSWFlat(dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+        elif index_type == "ivf":
+            # IVF倒排索引：聚类中心数取 4*sqrt(N)，至少需要同等数量的训练向量
+            nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors))
+            index = faiss.index_factory(dimension, f"IVF{nlist},Flat", faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "ivfpq":
+            # IVF+乘积量化：每8维压缩为1字节（FP32的1/32），检索时用查表代替乘加，
+            # 候选再用chunk_embeddings精确重排以弥补量化误差
+            nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+            m = next(m for m in range(max(1, dimension // 8), 0, -1) if dimension % m == 0)
+            index = faiss.index_factory(dimension, f"IVF{nlist},PQ{m}x8", faiss.METRIC_INNER_PRODUCT)
+        elif index_type in ("sq8", "fp16"):
+            # 标量量化平面索引：每维1字节（sq8）或2字节（fp16），扫描带宽为FP32的1/4或1/2
+            qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+            index = faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "hnsw_sq":
+            # HNSW图 + 8位标量量化存储
+            index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+        else:
+            # 内积平面索引（适合中小规模数据）
+            index = faiss.IndexFlatIP(dimension)
         
+        self._configure_search_params(index)
         logger.info(f"📊 创建FAISS索引: {type(index).__name__}")
         return index
     
+    def _configure_search_params(self, index: faiss.Index):
+        """设置检索参数（HNSW的efSearch、IVF的nprobe），其他索引类型忽略"""
+        index = faiss.downcast_index(index)
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.ef_search
+        if hasattr(index, "nprobe"):
+            index.nprobe = self.nprobe
+    
     def build_index(self, chunks: List[DocumentChunk], batch_size: int = 32, embedding_manager=None) -> bool:
         """
         构建向量索引
@@ -95,41 +292,66 @@ class VectorStore:
         try:
             # 获取embedding管理器 - 使用SDPA优化
             if embedding_manager is None:
-                embedding_manager = get_embedding_manager(attn_implementation="sdpa")
+                embedding_manager = self.embedding_manager
             
             if not embedding_manager.is_model_loaded():
                 logger.error("❌ Embedding模型未加载")
                 return False
             
-            # 提取文本内容
-            texts = [chunk.content for chunk in chunks]
-            
-            # 批量编码文本
+            # 按窗口流式编码：每个窗口编码后立即归一化、写入预分配的向量数组并加入索引，
+            # 不再同时持有完整的编码结果和它的FP32副本
             logger.info("🔄 正在编码文本...")
-            embeddings = embedding_manager.encode_texts(
-                texts, 
-                batch_size=batch_size, 
-                show_progress=True
-            )
-            
-            if len(embeddings) == 0:
-                logger.error("❌ 文本编码失败")
-                return False
+            window = batch_size * _BUILD_WINDOW_BATCHES
+            embeddings = None
             
-            # 更新向量维度
-            self.embedding_dim = embeddings.shape[1]
-            logger.info(f"📐 实际向量维度: {self.embedding_dim}")
-            
-            # 创建FAISS索引
-            self.index = self._create_faiss_index(self.embedding_dim)
+            for start in tqdm(range(0, len(chunks), window), desc="🔄 编码文本"):
+                window_chunks = chunks[start:start + window]
+                batch = embedding_manager.encode_texts(
+                    (chunk.content for chunk in window_chunks),
+                    batch_size=batch_size,
+                    show_progress=False,
+                    total=len(window_chunks)
+                )
+                
+                if len(batch) != len(window_chunks):
+                    logger.error("❌ 文本编码失败")
+                    return False
+                
+                # L2归一化，使内积等于余弦相似度
+                batch = _ensure_f32_contig(batch)
+                faiss.normalize_L2(batch)
+                
+                if embeddings is None:
+                    # 更新向量维度并创建FAISS索引
+                    self.embedding_dim = batch.shape[1]
+                    logger.info(f"📐 实际向量维度: {self.embedding_dim}")
+                    self.index = self._create_faiss_index(self.embedding_dim, len(chunks))
+                    # 需要训练的索引用FP32向量训练，其余直接按保存精度存放
+                    dtype = self.embedding_dtype if self.index.is_trained else np.float32
+                    embeddings = np.empty((len(chunks), self.embedding_dim), dtype=dtype)
+                
+                embeddings[start:start + len(batch)] = batch
+                
+                # 无需训练的索引（平面、HNSW）边编码边添加
+                if self.index.is_trained:
+                    self.index.add(batch)
             
-            # 添加向量到索引
-            logger.info("📊 添加向量到索引...")
-            self.index.add(embeddings.astype(np.float32))
+            # 需要训练的索引（如IVF、量化索引）在全部编码后训练，再添加向量
+            if not self.index.is_trained:
+                logger.info("🎯 训练FAISS索引...")
+                self.index.train(embeddings)
+                logger.info("📊 添加向量到索引...")
+                self.index.add(embeddings)
             
             # 保存数据
             self.chunks = chunks
-            self.chunk_embeddings = embeddings
+            self.chunk_embeddings = embeddings.astype(self.embedding_dtype, copy=False)
+            self.generation += 1
+            self._statistics_cache = None
+            self._q8_index = None
+            self._cagra_index = None
+            self._gpu_index = None
+            self._build_metadata_arrays()
             
             logger.info(f"✅ 向量索引构建完成!")
             logger.info(f"📊 索引大小: {self.index.ntotal}")
@@ -154,16 +376,21 @@ class VectorStore:
             
             logger.info("💾 保存向量索引...")
             
-            # 保存FAISS索引
-            faiss.write_index(self.index, str(self.index_file))
+            # 保存FAISS索引（先写临时文件再替换，不影响正在内存映射的旧文件）
+            tmp_index_file = self.index_file.with_name(self.index_file.name + ".tmp")
+            faiss.write_index(self.index, str(tmp_index_file))
+            os.replace(tmp_index_file, self.index_file)
             
-            # 保存文档块元数据
-            with open(self.chunks_file, 'wb') as f:
-                pickle.dump(self.chunks, f)
+            # 保存文档块元数据（优先列式格式，metadata无法JSON序列化时回退到pickle）
+            if not self._save_chunk_columns():
+                with open(self.chunks_file, 'wb') as f:
+                    pickle.dump(self.chunks, f, protocol=5)
             
             # 保存embeddings
             if self.chunk_embeddings is not None:
-                np.save(self.embeddings_file, self.chunk_embeddings)
+                tmp_embeddings_file = self.embeddings_file.with_suffix(".tmp.npy")
+                np.save(tmp_embeddings_file, self.chunk_embeddings, allow_pickle=False)
+                os.replace(tmp_embeddings_file, self.embeddings_file)
             
             logger.info(f"✅ 索引保存成功!")
             logger.info(f"📄 索引文件: {self.index_file}")
@@ -189,21 +416,40 @@ class VectorStore:
             
             logger.info("📂 加载向量索引...")
             
-            # 加载FAISS索引
-            self.index = faiss.read_index(str(self.index_file))
+            # 加载FAISS索引（内存映射只读打开，由操作系统页缓存按需读入；重建索引时仍在内存中构建）
+            self.generation += 1
+            self._statistics_cache = None
+            self.index = None
+            if self.mmap:
+                try:
+                    self.index = faiss.read_index(str(self.index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                except RuntimeError as e:
+                    logger.warning(f"⚠️ 该索引类型不支持内存映射，改为完整读入: {str(e)}")
+            if self.index is None:
+                self.index = faiss.read_index(str(self.index_file))
+            self._configure_search_params(self.index)
             
-            # 加载文档块元数据
-            if self.chunks_file.exists():
+            # 加载文档块元数据（列式格式优先，兼容旧版pickle）
+            if self.columns_file.exists():
+                self._load_chunk_columns()
+            elif self.chunks_file.exists():
                 with open(self.chunks_file, 'rb') as f:
                     self.chunks = pickle.load(f)
             
             # 加载embeddings
             if self.embeddings_file.exists():
-                self.chunk_embeddings = np.load(self.embeddings_file)
+                self.chunk_embeddings = np.load(self.embeddings_file, mmap_mode='r' if self.mmap else None,
+                                                allow_pickle=False)
+            self._q8_index = None
+            self._cagra_index = None
+            self._gpu_index = None
+            self._ensure_metadata_arrays()
             
             # 更新维度信息
             if self.index:
                 self.embedding_dim = self.index.d
+                if not self._uses_inner_product():
+                    logger.warning("⚠️ 加载的是旧版L2距离索引，相似度为近似换算；重建索引后可得到余弦相似度")
             
             logger.info(f"✅ 索引加载成功!")
             logger.info(f"📊 索引大小: {self.index.ntotal}")
@@ -215,9 +461,317 @@ class VectorStore:
             logger.error(f"❌ 加载索引失败: {str(e)}")
             return False
     
+    def _save_chunk_columns(self) -> bool:
+        """
+        以列式格式保存文档块（各列为连续数组，读写不需要逐对象pickle）
+        
+        metadata以JSON保存，JSON会把元组变成列表、把非字符串的字典键变成字符串；
+        保存前逐块校验往返结果与原值相等，不相等时整体回退到pickle，保证加载后类型不变。
+        
+        Returns:
+            bool: 是否保存成功（metadata无法按原样JSON往返时返回False）
+        """
+        try:
+            metadata = [json.dumps(chunk.metadata, ensure_ascii=False) for chunk in self.chunks]
+            if any(json.loads(text) != chunk.metadata for text, chunk in zip(metadata, self.chunks)):
+                raise ValueError("metadata经JSON往返后发生变化")
+        except (TypeError, ValueError):
+            logger.warning("⚠️ 文档块metadata无法按原样JSON序列化，使用pickle保存")
+            self.columns_file.unlink(missing_ok=True)
+            return False
+        
+        columns = {name: np.array([getattr(chunk, name) for chunk in self.chunks], dtype=str)
+                   for name in _STR_COLUMNS}
+        columns.update({name: np.array([getattr(chunk, name) for chunk in self.chunks], dtype=np.int64)
+                        for name in _INT_COLUMNS})
+        columns["content"], columns["content_offsets"] = _pack_texts([chunk.content for chunk in self.chunks])
+        columns["metadata"], columns["metadata_offsets"] = _pack_texts(metadata)
+        
+        with open(self.columns_file, 'wb') as f:
+            np.savez(f, **columns)
+        # 删除旧版pickle，避免两份元数据不一致
+        self.chunks_file.unlink(missing_ok=True)
+        return True
+    
+    def _load_chunk_columns(self):
+        """从列式文件加载文档块，并直接复用省份/类型列作为过滤数组"""
+        with np.load(self.columns_file, allow_pickle=False) as data:
+            str_columns = {name: data[name] for name in _STR_COLUMNS}
+            char_count_column = data["char_count"]
+            int_columns = {name: data[name].tolist() for name in _INT_COLUMNS}
+            contents = _unpack_texts(data["content"], data["content_offsets"])
+            metadata = _unpack_texts(data["metadata"], data["metadata_offsets"])
+        
+        ids, provinces, chunk_types, sources = (str_columns[name].tolist() for name in _STR_COLUMNS)
+        char_counts, start_positions, end_positions, chunk_ids, word_counts = (
+            int_columns[name] for name in _INT_COLUMNS
+        )
+        self.chunks = [
+            DocumentChunk(
+                id=ids[i], province=provinces[i], content=contents[i], chunk_type=chunk_types[i],
+                metadata=json.loads(metadata[i]), char_count=char_counts[i], source=sources[i],
+                start_pos=start_positions[i], end_pos=end_positions[i], chunk_id=chunk_ids[i],
+                word_count=word_counts[i]
+            )
+            for i in range(len(ids))
+        ]
+        self._chunk_provinces = str_columns["province"]
+        self._chunk_types = str_columns["chunk_type"]
+        self._chunk_char_counts = char_count_column
+        self._metadata_chunks = self.chunks
+    
+    def _build_metadata_arrays(self):
+        """按文档块顺序构建省份/类型/字符数数组（与索引ID一一对应）"""
+        self._chunk_provinces = np.array([chunk.province for chunk in self.chunks], dtype=str)
+        self._chunk_types = np.array([chunk.chunk_type for chunk in self.chunks], dtype=str)
+        self._chunk_char_counts = np.array([chunk.char_count for chunk in self.chunks], dtype=np.int64)
+        self._metadata_chunks = self.chunks
+    
+    def _ensure_metadata_arrays(self):
+        """文档块列表被替换或数量变化后重建省份/类型/字符数数组"""
+        if self._metadata_chunks is not self.chunks or len(self._chunk_provinces) != len(self.chunks):
+            self._build_metadata_arrays()
+    
+    def _encode_queries(self, queries: List[str], batch_size: int = 32) -> np.ndarray:
+        """批量编码查询文本（带LRU缓存），未命中的查询合并为一次模型调用，返回形状为(查询数, 维度)的向量"""
+        # 先取出本批次命中的向量并刷新其LRU位置，之后插入新条目时的淘汰不会影响本批次的结果
+        rows = {}
+        for query in dict.fromkeys(queries):
+            cached = self._query_embedding_cache.get(query)
+            if cached is not None:
+                self._query_embedding_cache.move_to_end(query)
+                rows[query] = cached
+        
+        missing = [query for query in dict.fromkeys(queries) if query not in rows]
+        if missing:
+            embeddings = self.embedding_manager.encode_texts(missing, batch_size=batch_size, show_progress=False)
+            if len(embeddings) != len(missing):
+                return np.empty((0, self.embedding_dim), dtype=np.float32)
+            
+            self._query_cache_misses += len(missing)
+            for query, embedding in zip(missing, embeddings):
+                embedding = embedding[np.newaxis, :]
+                embedding.setflags(write=False)
+                rows[query] = embedding
+                self._query_embedding_cache[query] = embedding
+                if len(self._query_embedding_cache) > _QUERY_CACHE_SIZE:
+                    self._query_embedding_cache.popitem(last=False)
+        
+        self._query_cache_hits += len(queries) - len(missing)
+        return np.concatenate([rows[query] for query in queries], axis=0)
+    
+    def _encode_query(self, query: str) -> np.ndarray:
+        """编码查询文本（带LRU缓存），返回形状为(1, 维度)的向量；编码失败时返回空数组"""
+        cached = self._query_embedding_cache.get(query)
+        if cached is not None:
+            self._query_embedding_cache.move_to_end(query)
+            self._query_cache_hits += 1
+            return cached
+        
+        self._query_cache_misses += 1
+        
+        # 编码查询文本 - 使用SDPA优化
+        query_embedding = self.embedding_manager.encode_texts([query], show_progress=False)
+        
+        if len(query_embedding) > 0:
+            query_embedding.setflags(write=False)  # 缓存的向量在各次检索间共享
+            self._query_embedding_cache[query] = query_embedding
+            if len(self._query_embedding_cache) > _QUERY_CACHE_SIZE:
+                self._query_embedding_cache.popitem(last=False)
+        
+        return query_embedding
+    
+    def _uses_inner_product(self) -> bool:
+        """当前索引是否为内积度量（旧版索引使用L2距离，检索时保持原有的分数换算）"""
+        return self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+    
+    def _apply_ef_search(self, ef_search: Optional[int], search_k: int):
+        """为HNSW索引设置本次检索的搜索宽度（未指定时用默认值，且不小于候选数量）；其他索引类型忽略"""
+        hnsw = getattr(faiss.downcast_index(self.index), "hnsw", None)
+        if hnsw is not None:
+            hnsw.efSearch = max(ef_search if ef_search is not None else self.ef_search, search_k)
+    
+    def _has_exact_embeddings(self) -> bool:
+        """chunk_embeddings是否与索引一一对应（可用于精确重排）"""
+        return self.chunk_embeddings is not None and len(self.chunk_embeddings) == self.index.ntotal
+    
+    def _has_approximate_scores(self) -> bool:
+        """当前索引是否存储量化后的向量（乘积量化或标量量化，分数为近似值）"""
+        index = faiss.downcast_index(self.index)
+        storage = getattr(index, "storage", None)  # HNSW的向量存储
+        if storage is not None:
+            index = faiss.downcast_index(storage)
+        return hasattr(index, "pq") or hasattr(index, "sq")
+    
+    def _get_q8_index(self) -> Optional[faiss.Index]:
+        """获取8位标量量化索引（首次使用或索引变化后由chunk_embeddings构建），不可用时返回None"""
+        if not self._has_exact_embeddings():
+            return None
+        
+        if self._q8_index is None or self._q8_index.ntotal != self.index.ntotal:
+            embeddings = _ensure_f32_contig(self.chunk_embeddings)
+            q8_index = faiss.IndexScalarQuantizer(
+                self.embedding_dim, faiss.ScalarQuantizer.QT_8bit, self.index.metric_type
+            )
+            q8_index.train(embeddings)
+            q8_index.add(embeddings)
+            self._q8_index = q8_index
+            logger.info(f"📦 构建8位量化候选索引: {q8_index.ntotal} 个向量")
+        
+        return self._q8_index
+    
+    def _get_cagra_index(self):
+        """获取GPU上的CAGRA索引（首次使用时由chunk_embeddings构建），不可用时返回None"""
+        if self.backend != "cagra":
+            return None
+        if not self._has_exact_embeddings():
+            return None
+        
+        if self._cagra_index is None:
+            try:
+                metric = "inner_product" if self.index.metric_type == faiss.METRIC_INNER_PRODUCT else "sqeuclidean"
+                dataset = cp.asarray(self.chunk_embeddings, dtype=cp.float32)
+                self._cagra_index = cagra.build(cagra.IndexParams(metric=metric), dataset)
+                logger.info(f"🚀 构建CAGRA GPU索引: {len(self.chunk_embeddings)} 个向量")
+            except Exception as e:
+                logger.warning(f"⚠️ CAGRA索引构建失败，回退到faiss: {str(e)}")
+                self.backend = "faiss"
+                return None
+        
+        return self._cagra_index
+    
+    def _get_gpu_index(self) -> Optional[faiss.Index]:
+        """获取主索引的FAISS GPU副本（首次使用时复制），无GPU或索引类型不支持时返回None"""
+        if self._gpu_index is None:
+            self._gpu_index = False  # 复制失败时不再重试
+            if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+                return None
+            if hasattr(faiss.downcast_index(self.index), "hnsw"):
+                return None
+            try:
+                self._gpu_resources = faiss.StandardGpuResources()
+                self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+                logger.info(f"🚀 复制FAISS索引到GPU: {self.index.ntotal} 个向量")
+            except Exception as e:
+                logger.warning(f"⚠️ FAISS GPU索引创建失败，批量检索使用CPU: {str(e)}")
+        
+        return self._gpu_index or None
+    
+    def _search_index(self, query_embedding: np.ndarray, search_k: int,
+                      ef_search: Optional[int] = None,
+                      quantized: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在索引中检索search_k个候选
+        
+        后端为cagra时在GPU图索引上检索；量化索引（PQ/SQ）先取2倍候选再用FP32向量精确重排；
+        否则quantized为True时先在8位量化索引上取2倍候选（每维1字节，扫描带宽为FP32的1/4），
+        再用FP32向量精确重排，返回与主索引相同度量的分数。批量查询较多且有GPU时，
+        平面/IVF索引在FAISS GPU副本上检索。
+        """
+        query = _ensure_f32_contig(query_embedding)
+        if self._uses_inner_product():
+            # 原地归一化，只有在没有新建数组时（如缓存中只读的查询向量）才需要拷贝
+            if query is query_embedding:
+                query = query.copy()
+            faiss.normalize_L2(query)
+        
+        # GPU图索引：一次调用完成整个候选窗口的检索（itopk_size需不小于k）
+        cagra_index = self._get_cagra_index()
+        if cagra_index is not None:
+            try:
+                search_params = cagra.SearchParams(itopk_size=max(64, search_k))
+                distances, neighbors = cagra.search(search_params, cagra_index, cp.asarray(query), search_k)
+                return cp.asnumpy(cp.asarray(distances)), cp.asnumpy(cp.asarray(neighbors)).astype(np.int64)
+            except Exception as e:
+                logger.warning(f"⚠️ CAGRA检索失败，回退到faiss: {str(e)}")
+                self.backend = "faiss"
+        
+        # 量化索引的分数是近似值：取2倍候选后用FP32向量精确重排
+        if self._has_approximate_scores() and self._has_exact_embeddings():
+            candidate_k = min(search_k * 2, self.index.ntotal)
+            self._apply_ef_search(ef_search, candidate_k)
+            _, candidates = self.index.search(query, candidate_k)
+            return self._rerank_exact(query, candidates, search_k)
+        
+        q8_index = self._get_q8_index() if quantized else None
+        if q8_index is None:
+            # 查询足够多时在GPU上一次完成（拷贝开销被批量摊薄）
+            if len(query) >= _GPU_BATCH_MIN_QUERIES and search_k <= _GPU_MAX_K:
+                gpu_index = self._get_gpu_index()
+                if gpu_index is not None:
+                    return gpu_index.search(query, search_k)
+            self._apply_ef_search(ef_search, search_k)
+            return self.index.search(query, search_k)
+        
+        _, candidates = q8_index.search(query, min(search_k * 2, q8_index.ntotal))
+        return self._rerank_exact(query, candidates, search_k)
+    
+    def _rerank_exact(self, query: np.ndarray, all_candidates: np.ndarray,
+                      search_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用chunk_embeddings中的FP32向量为每个查询的候选精确打分，返回前search_k个（不足时以-1补齐）"""
+        scores = np.full((len(query), search_k), -np.inf if self._uses_inner_product() else np.inf, dtype=np.float32)
+        indices = np.full((len(query), search_k), -1, dtype=np.int64)
+        
+        inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        # Numba核直接读取FP32向量（float16存储时仍用NumPy先转换候选行）
+        use_kernel = numba is not None and self.chunk_embeddings.dtype == np.float32
+        if use_kernel:
+            embeddings = np.asarray(self.chunk_embeddings)  # 内存映射数组按普通数组视图传入，不拷贝
+        
+        for i, candidates in enumerate(all_candidates):
+            candidates = np.ascontiguousarray(candidates[candidates >= 0])
+            
+            # FP32精确重排
+            if use_kernel:
+                exact = np.empty(len(candidates), dtype=np.float32)
+                _rerank_kernel(query[i], embeddings, candidates, inner_product, exact)
+            elif inner_product:
+                exact = np.asarray(self.chunk_embeddings[candidates], dtype=np.float32) @ query[i]
+            else:
+                diff = np.asarray(self.chunk_embeddings[candidates], dtype=np.float32) - query[i]
+                exact = np.einsum('ij,ij->i', diff, diff)
+            order = np.argsort(-exact if inner_product else exact, kind="stable")[:search_k]
+            
+            scores[i, :len(order)] = exact[order]
+            indices[i, :len(order)] = candidates[order]
+        
+        return scores, indices
+    
+    def _filter_hits(self, scores: np.ndarray, indices: np.ndarray, top_k: int,
+                     province_filter: Optional[str] = None,
+                     chunk_type_filter: Optional[str] = None) -> List[List[Tuple[DocumentChunk, float]]]:
+        """
+        对索引返回的 (查询数, k) 结果做向量化过滤，每行按原顺序保留前top_k个
+        
+        过滤条件在预先构建的省份/类型数组上计算布尔掩码，不逐个访问文档块属性。
+        """
+        self._ensure_metadata_arrays()
+        
+        # 无效ID（-1或超出文档块范围）先映射到0再由valid屏蔽
+        valid = (indices >= 0) & (indices < len(self.chunks))
+        safe_indices = np.where(valid, indices, 0)
+        if province_filter:
+            valid &= self._chunk_provinces[safe_indices] == province_filter
+        if chunk_type_filter:
+            valid &= self._chunk_types[safe_indices] == chunk_type_filter
+        
+        inner_product = self._uses_inner_product()
+        results = []
+        for row_scores, row_indices, row_valid in zip(scores, indices, valid):
+            keep = np.flatnonzero(row_valid)[:top_k]
+            # 内积索引的分数即余弦相似度；旧版L2索引把距离近似转换为相似度
+            similarities = row_scores[keep] if inner_product else 1.0 / (1.0 + row_scores[keep])
+            results.append([
+                (self.chunks[idx], float(similarity))
+                for idx, similarity in zip(row_indices[keep].tolist(), similarities.tolist())
+            ])
+        return results
+    
     def search(self, query: str, top_k: int = 10, 
                province_filter: Optional[str] = None,
-               chunk_type_filter: Optional[str] = None) -> List[Tuple[DocumentChunk, float]]:
+               chunk_type_filter: Optional[str] = None,
+               ef_search: Optional[int] = None,
+               quantized: bool = False) -> List[Tuple[DocumentChunk, float]]:
         """
         搜索相关文档
         
@@ -226,6 +780,8 @@ class VectorStore:
             top_k: 返回结果数量
             province_filter: 省份过滤
             chunk_type_filter: 块类型过滤
+            ef_search: HNSW索引的搜索宽度（可选，非HNSW索引忽略）
+            quantized: 是否使用8位量化索引做候选检索（FP32重排）
             
         Returns:
             List[Tuple[DocumentChunk, float]]: (文档块, 相似度分数)列表
@@ -235,9 +791,8 @@ class VectorStore:
             return []
         
         try:
-            # 编码查询文本 - 使用SDPA优化
-            embedding_manager = get_embedding_manager(attn_implementation="sdpa")
-            query_embedding = embedding_manager.encode_texts([query], show_progress=False)
+            # 编码查询文本（命中缓存时跳过模型推理）
+            query_embedding = self._encode_query(query)
             
             if len(query_embedding) == 0:
                 logger.error("❌ 查询编码失败")
@@ -245,33 +800,9 @@ class VectorStore:
             
             # 搜索相似向量 - 支持大量检索
             search_k = min(max(top_k * 4, 200), self.index.ntotal)  # 至少搜索200个结果，最多4倍
-            scores, indices = self.index.search(
-                query_embedding.astype(np.float32), 
-                search_k
-            )
+            scores, indices = self._search_index(query_embedding, search_k, ef_search, quantized)
             
-            results = []
-            
-            for score, idx in zip(scores[0], indices[0]):
-                if idx >= len(self.chunks):
-                    continue
-                
-                chunk = self.chunks[idx]
-                
-                # 应用过滤器
-                if province_filter and chunk.province != province_filter:
-                    continue
-                
-                if chunk_type_filter and chunk.chunk_type != chunk_type_filter:
-                    continue
-                
-                # 转换距离为相似度分数 (L2距离转余弦相似度近似)
-                similarity = 1.0 / (1.0 + score)
-                
-                results.append((chunk, similarity))
-                
-                if len(results) >= top_k:
-                    break
+            results = self._filter_hits(scores, indices, top_k, province_filter, chunk_type_filter)[0]
             
             logger.debug(f"🔍 搜索完成: 查询='{query[:50]}...', 结果数={len(results)}")
             
@@ -281,6 +812,118 @@ class VectorStore:
             logger.error(f"❌ 搜索失败: {str(e)}")
             return []
     
+    def search_batch(self, queries: List[str], top_k: int = 10,
+                     province_filter: Optional[str] = None,
+                     chunk_type_filter: Optional[str] = None,
+                     ef_search: Optional[int] = None,
+                     quantized: bool = False,
+                     batch_size: int = 32) -> List[List[Tuple[DocumentChunk, float]]]:
+        """
+        批量搜索多个查询（查询一次性编码，索引一次调用完成全部检索）
+        
+        每个查询的结果与单独调用 search 相同；多个查询合并为矩阵后FAISS可走矩阵乘法（GEMM）路径。
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的结果数量
+            province_filter: 省份过滤
+            chunk_type_filter: 块类型过滤
+            ef_search: HNSW索引的搜索宽度（可选，非HNSW索引忽略）
+            quantized: 是否使用8位量化索引做候选检索（FP32重排）
+            batch_size: 编码查询时的批大小
+            
+        Returns:
+            List[List[Tuple[DocumentChunk, float]]]: 与queries顺序对应的 (文档块, 相似度分数) 列表
+        """
+        if self.index is None:
+            logger.error("❌ 索引未加载")
+            return [[] for _ in queries]
+        if not queries:
+            return []
+        
+        try:
+            query_embeddings = self._encode_queries(queries, batch_size)
+            
+            if len(query_embeddings) == 0:
+                logger.error("❌ 查询编码失败")
+                return [[] for _ in queries]
+            
+            search_k = min(max(top_k * 4, 200), self.index.ntotal)
+            scores, indices = self._search_index(query_embeddings, search_k, ef_search, quantized)
+            
+            results = self._filter_hits(scores, indices, top_k, province_filter, chunk_type_filter)
+            
+            logger.debug(f"🔍 批量搜索完成: 查询数={len(queries)}")
+            
+            return results
+            
+        except Exception as e:
+            logger.error(f"❌ 批量搜索失败: {str(e)}")
+            return [[] for _ in queries]
+    
+    def search_grouped_by_province(self, query: str, provinces: List[str], top_k_per_province: int,
+                                   candidate_top_k: Optional[int] = None,
+                                   ef_search: Optional[int] = None,
+                                   quantized: bool = False) -> Dict[str, List[Tuple[DocumentChunk, float]]]:
+        """
+        一次检索同时为多个省份返回结果（查询只编码一次、索引只搜索一次）
+        
+        与逐省调用 search(query, top_k=candidate_top_k, province_filter=省份) 后各取前
+        top_k_per_province 个的结果一致：各省份共用同一个候选窗口，再按省份分桶。
+        
+        Args:
+            query: 查询文本
+            provinces: 省份列表
+            top_k_per_province: 每个省份返回的结果数量
+            candidate_top_k: 决定候选窗口大小的top_k（默认等于top_k_per_province）
+            ef_search: HNSW索引的搜索宽度（可选，非HNSW索引忽略）
+            quantized: 是否使用8位量化索引做候选检索（FP32重排）
+            
+        Returns:
+            Dict[str, List[Tuple[DocumentChunk, float]]]: 省份 -> (文档块, 相似度分数)列表
+        """
+        grouped = {province: [] for province in provinces}
+        if self.index is None:
+            logger.error("❌ 索引未加载")
+            return grouped
+        
+        if candidate_top_k is None:
+            candidate_top_k = top_k_per_province
+        
+        try:
+            # 编码查询文本（命中缓存时跳过模型推理）
+            query_embedding = self._encode_query(query)
+            
+            if len(query_embedding) == 0:
+                logger.error("❌ 查询编码失败")
+                return grouped
+            
+            search_k = min(max(candidate_top_k * 4, 200), self.index.ntotal)
+            scores, indices = self._search_index(query_embedding, search_k, ef_search, quantized)
+            
+            # 候选已按分数排序：每个省份取其掩码中前top_k_per_province个位置，只为最终结果取文档块
+            self._ensure_metadata_arrays()
+            indices = indices[0]
+            valid = (indices >= 0) & (indices < len(self.chunks))
+            indices = indices[valid]
+            hit_provinces = self._chunk_provinces[indices]
+            similarities = scores[0][valid] if self._uses_inner_product() else 1.0 / (1.0 + scores[0][valid])
+            
+            for province, bucket in grouped.items():
+                keep = np.flatnonzero(hit_provinces == province)[:top_k_per_province]
+                bucket.extend(
+                    (self.chunks[idx], similarity)
+                    for idx, similarity in zip(indices[keep].tolist(), similarities[keep].tolist())
+                )
+            
+            logger.debug(f"🔍 分省检索完成: 查询='{query[:50]}...', 省份数={len(grouped)}")
+            
+            return grouped
+            
+        except Exception as e:
+            logger.error(f"❌ 分省检索失败: {str(e)}")
+            return {province: [] for province in provinces}
+    
     def get_chunks_by_province(self, province: str) -> List[DocumentChunk]:
         """
         获取指定省份的所有文档块
@@ -291,7 +934,8 @@ class VectorStore:
         Returns:
             List[DocumentChunk]: 文档块列表
         """
-        return [chunk for chunk in self.chunks if chunk.province == province]
+        self._ensure_metadata_arrays()
+        return [self.chunks[i] for i in np.flatnonzero(self._chunk_provinces == province).tolist()]
     
     def get_chunks_by_type(self, chunk_type: str) -> List[DocumentChunk]:
         """
@@ -303,7 +947,8 @@ class VectorStore:
         Returns:
             List[DocumentChunk]: 文档块列表
         """
-        return [chunk for chunk in self.chunks if chunk.chunk_type == chunk_type]
+        self._ensure_metadata_arrays()
+        return [self.chunks[i] for i in np.flatnonzero(self._chunk_types == chunk_type).tolist()]
     
     def get_statistics(self) -> Dict:
         """
@@ -315,23 +960,17 @@ class VectorStore:
         if not self.chunks:
             return {}
         
-        # 省份统计
-        province_stats = {}
-        type_stats = {}
+        # 分组统计只在加载或重建索引后重新计算
+        if self._statistics_cache is None:
+            self._ensure_metadata_arrays()
+            self._statistics_cache = self._group_statistics()
+        provinces, province_counts, province_chars, chunk_types, type_counts = self._statistics_cache
         
-        for chunk in self.chunks:
-            # 省份统计
-            province = chunk.province
-            if province not in province_stats:
-                province_stats[province] = {"count": 0, "total_chars": 0}
-            province_stats[province]["count"] += 1
-            province_stats[province]["total_chars"] += chunk.char_count
-            
-            # 类型统计
-            chunk_type = chunk.chunk_type
-            if chunk_type not in type_stats:
-                type_stats[chunk_type] = 0
-            type_stats[chunk_type] += 1
+        province_stats = {
+            province: {"count": count, "total_chars": chars}
+            for province, count, chars in zip(provinces, province_counts, province_chars)
+        }
+        type_stats = dict(zip(chunk_types, type_counts))
         
         return {
             "total_chunks": len(self.chunks),
@@ -339,9 +978,31 @@ class VectorStore:
             "index_size": self.index.ntotal if self.index else 0,
             "embedding_dimension": self.embedding_dim,
             "province_stats": province_stats,
-            "type_stats": type_stats
+            "type_stats": type_stats,
+            "query_cache": {
+                "size": len(self._query_embedding_cache),
+                "hits": self._query_cache_hits,
+                "misses": self._query_cache_misses
+            }
         }
     
+    def _group_statistics(self) -> Tuple[list, list, list, list, list]:
+        """按省份（数量、字符数）和类型（数量）分组统计，分组按首次出现的顺序排列"""
+        def group(values: np.ndarray):
+            uniques, first_index, inverse, counts = np.unique(
+                values, return_index=True, return_inverse=True, return_counts=True
+            )
+            order = np.argsort(first_index, kind="stable")
+            return uniques, inverse, counts, order
+        
+        provinces, inverse, province_counts, order = group(self._chunk_provinces)
+        province_chars = np.zeros(len(provinces), dtype=np.int64)
+        np.add.at(province_chars, inverse.ravel(), self._chunk_char_counts)
+        province_stats = (provinces[order].tolist(), province_counts[order].tolist(), province_chars[order].tolist())
+        
+        chunk_types, _, type_counts, order = group(self._chunk_types)
+        return (*province_stats, chunk_types[order].tolist(), type_counts[order].tolist())
+    
     def is_built(self) -> bool:
         """检查索引是否已构建"""
         return self.index is not None and self.index.ntotal > 0
@@ -353,15 +1014,29 @@ def get_vector_store() -> VectorStore:
     """获取全局向量存储实例 - 使用SDPA优化"""
     global _vector_store
     if _vector_store is None:
-        from config.config import DATA_PATHS
+        from config import config as app_config
+        
+        # 向量存储配置（旧配置文件中没有该项时使用默认值）
+        vector_config = getattr(app_config, "VECTOR_STORE_CONFIG", {})
         
         # 获取embedding维度 - 使用SDPA优化
         embedding_manager = get_embedding_manager(attn_implementation="sdpa")
         embedding_dim = embedding_manager.get_embedding_dimension()
         
         _vector_store = VectorStore(
-            store_path=str(DATA_PATHS["vector_store"]),
-            embedding_dim=embedding_dim
+            store_path=str(app_config.DATA_PATHS["vector_store"]),
+            embedding_dim=embedding_dim,
+            backend=vector_config.get("backend", "faiss"),
+            index_type=vector_config.get("index_type", "auto"),
+            hnsw_m=vector_config.get("hnsw_m", 32),
+            ef_construction=vector_config.get("ef_construction", 200),
+            ef_search=vector_config.get("ef_search", 64),
+            nprobe=vector_config.get("nprobe", 16),
+            mmap=vector_config.get("mmap", True),
+            embedding_dtype=vector_config.get("embedding_dtype", "float32"),
+            omp_threads=vector_config.get("omp_threads"),
+            blas_threshold=vector_config.get("blas_threshold", 8),
+            embedding_manager=embedding_manager
         )
         
         # 尝试加载已有索引
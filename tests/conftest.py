@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试公共配置
+src下的模块以裸模块名互相导入；未创建config/config.py时使用示例配置
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "src"))
+
+if not (ROOT / "config" / "config.py").exists():
+    spec = importlib.util.spec_from_file_location("config.config", ROOT / "config" / "config.example.py")
+    example_config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(example_config)
+    import config
+    config.config = example_config
+    sys.modules["config.config"] = example_config
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查询路由器测试（检索器和API客户端使用假实现，不加载模型、不发起网络请求）
+"""
+
+import importlib
+import sys
+import types
+from dataclasses import dataclass, field
+from typing import List, Set
+
+import pytest
+
+
+@dataclass
+class FakeRetrievalResult:
+    chunks: List = field(default_factory=list)
+    provinces: Set[str] = field(default_factory=set)
+
+
+class FakeRetriever:
+    def __init__(self):
+        self.calls = []
+
+    def smart_retrieve(self, query):
+        self.calls.append((query, None))
+        return FakeRetrievalResult()
+
+    def retrieve_for_specific_provinces(self, query, provinces, top_k_per_province=None):
+        self.calls.append((query, tuple(provinces)))
+        return FakeRetrievalResult(provinces=set(provinces))
+
+    def format_context(self, result):
+        return "、".join(sorted(result.provinces))
+
+
+@dataclass
+class FakeResponse:
+    content: str
+    success: bool = True
+    error: str = None
+
+
+class FakeAPIClient:
+    """
+    按提示词中的问题数量生成带编号的回答；truncate_after指定只回答前几个部分，
+    fail_merged / fail_single 让合并调用 / 单独调用返回失败
+    """
+
+    def __init__(self, truncate_after=None, fail_merged=False, fail_single=False):
+        self.truncate_after = truncate_after
+        self.fail_merged = fail_merged
+        self.fail_single = fail_single
+        self.calls = []
+
+    def simple_chat(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        if "【第1部分参考资料】" not in prompt:
+            if self.fail_single:
+                return FakeResponse(content="", success=False, error="单独调用失败")
+            return FakeResponse(content="单独回答")
+        if self.fail_merged:
+            return FakeResponse(content="", success=False, error="请求超时")
+        count = prompt.count("部分参考资料】")
+        answered = count if self.truncate_after is None else self.truncate_after
+        return FakeResponse(
+            content="\n".join(f"【第{i}部分】\n回答{i}" for i in range(1, answered + 1))
+        )
+
+
+@pytest.fixture
+def make_router(monkeypatch):
+    def factory(api_client):
+        retriever = FakeRetriever()
+        retriever_module = types.ModuleType("retriever")
+        retriever_module.RetrievalResult = FakeRetrievalResult
+        retriever_module.get_retriever = lambda: retriever
+        api_module = types.ModuleType("api_client")
+        api_module.get_api_client = lambda: api_client
+        monkeypatch.setitem(sys.modules, "retriever", retriever_module)
+        monkeypatch.setitem(sys.modules, "api_client", api_module)
+        monkeypatch.delitem(sys.modules, "query_router", raising=False)
+        query_router = importlib.import_module("query_router")
+        monkeypatch.delitem(sys.modules, "query_router")
+        return query_router.QueryRouter(), retriever
+    return factory
+
+
+def _province_group_plan(router):
+    analysis = router.analyze_query("详细分析所有省份的主要工作目标")
+    plan = router.create_query_plan(analysis)
+    assert plan.batch_strategy == "province_groups"
+    return plan
+
+
+def test_default_province_group_plan_merges_into_one_call(make_router):
+    router, _ = make_router(FakeAPIClient())
+    plan = _province_group_plan(router)
+
+    merged = router._maybe_merge_batches(plan)
+
+    assert len(merged) == 1
+    assert merged[0]["type"] == "merged"
+    assert merged[0]["sub_batches"] == plan.batches
+
+
+def test_merged_response_splits_back_per_batch(make_router):
+    api_client = FakeAPIClient()
+    router, _ = make_router(api_client)
+    plan = _province_group_plan(router)
+
+    result = router.execute_query_plan(plan)
+
+    assert len(api_client.calls) == 1
+    assert result["successful_batches"] == len(plan.batches)
+    assert [r["content"] for r in result["batch_results"]] == [
+        f"回答{i}" for i in range(1, len(plan.batches) + 1)
+    ]
+    assert [r["batch_info"] for r in result["batch_results"]] == plan.batches
+
+
+def test_truncated_sections_are_requeried(make_router):
+    api_client = FakeAPIClient(truncate_after=2)
+    router, _ = make_router(api_client)
+    plan = _province_group_plan(router)
+
+    result = router.execute_query_plan(plan)
+
+    assert len(api_client.calls) == 1 + len(plan.batches) - 2
+    assert [r["content"] for r in result["batch_results"]] == ["回答1", "回答2"] + [
+        "单独回答"
+    ] * (len(plan.batches) - 2)
+
+
+def test_keyword_stats_count_every_keyword_present(make_router):
+    router, _ = make_router(FakeAPIClient())
+    router.collect_keyword_stats = True
+
+    router.analyze_query("全国31省所有省份的对比分析")
+
+    stats = router.get_keyword_stats()
+    assert stats["complexity.coverage"] == {"所有省份": 1, "31省": 1, "全国": 1}
+    assert stats["complexity.analysis"] == {"对比": 1, "分析": 1}
+    assert stats["scope.comprehensive"] == {"所有": 1, "全国": 1, "31省": 1}
+
+
+def test_requeried_sections_reuse_their_retrieval(make_router):
+    router, retriever = make_router(FakeAPIClient(truncate_after=2))
+    plan = _province_group_plan(router)
+
+    router.execute_query_plan(plan)
+
+    assert retriever.calls == [
+        (batch["query"], tuple(batch["provinces"])) for batch in plan.batches
+    ]
+
+
+def test_merged_groups_respect_context_budget(make_router, monkeypatch):
+    api_client = FakeAPIClient()
+    router, _ = make_router(api_client)
+    plan = _province_group_plan(router)
+    contexts = ["、".join(sorted(batch["provinces"])) for batch in plan.batches]
+    budget = len(contexts[0]) + len(contexts[1])
+    monkeypatch.setitem(sys.modules["config.config"].QUERY_CONFIG, "merge_max_context_chars", budget)
+
+    result = router.execute_query_plan(plan)
+
+    assert len(api_client.calls) > 1
+    for prompt, _ in api_client.calls:
+        sections = prompt.split("部分参考资料】\n")[1:]
+        assert sum(len(section.split("\n")[0]) for section in sections) <= budget
+    assert result["successful_batches"] == len(plan.batches)
+    assert [r["batch_info"] for r in result["batch_results"]] == plan.batches
+
+
+def test_failed_merged_call_falls_back_to_single_batches(make_router):
+    api_client = FakeAPIClient(fail_merged=True)
+    router, retriever = make_router(api_client)
+    plan = _province_group_plan(router)
+
+    result = router.execute_query_plan(plan)
+
+    assert len(api_client.calls) == 1 + len(plan.batches)
+    assert len(retriever.calls) == len(plan.batches)
+    assert result["successful_batches"] == len(plan.batches)
+    assert [r["content"] for r in result["batch_results"]] == ["单独回答"] * len(plan.batches)
+
+
+def test_failed_requeries_are_counted(make_router):
+    api_client = FakeAPIClient(truncate_after=2, fail_single=True)
+    router, _ = make_router(api_client)
+    plan = _province_group_plan(router)
+
+    result = router.execute_query_plan(plan)
+
+    assert len(api_client.calls) == 1 + len(plan.batches) - 2
+    assert result["successful_batches"] == 2
+    assert result["failed_batches"] == len(plan.batches) - 2
+    assert result["successful_batches"] + result["failed_batches"] == result["total_batches"]
+
+
+def test_keyword_stats_off_by_default(make_router):
+    router, _ = make_router(FakeAPIClient())
+
+    analysis = router.analyze_query("全国31省所有省份的对比分析")
+
+    assert analysis["scope"] == "comprehensive"
+    assert analysis["complexity"] == "high"
+    assert router.get_keyword_stats() == {}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+结果聚合器测试
+"""
+
+import random
+
+import pytest
+
+import result_aggregator
+from result_aggregator import ResultAggregator
+
+
+def _exact_deduplicate(aggregator, targets):
+    """逐对计算相似度的参考实现（不做剪枝、不用Numba）"""
+    final_targets = []
+    for target in dict.fromkeys(targets):
+        for i, existing in enumerate(final_targets):
+            if aggregator._calculate_similarity(target, existing) > 0.8:
+                if len(target) > len(existing):
+                    final_targets[i] = target
+                break
+        else:
+            final_targets.append(target)
+    return final_targets
+
+
+def _synthetic_targets(unique_count, seed=0):
+    """生成互不相似的目标，并混入带后缀的近似重复项（如 "X" / "X等"）"""
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    base = ["".join(rng.choice(chars) for _ in range(rng.randint(12, 30))) for _ in range(unique_count)]
+    targets = list(base)
+    for target in rng.sample(base, unique_count // 2):
+        targets.append(target + rng.choice(["等", "工作", "。"]))
+    rng.shuffle(targets)
+    return targets
+
+
+@pytest.fixture(scope="module")
+def aggregator():
+    return ResultAggregator()
+
+
+@pytest.mark.parametrize("unique_count", [150, 700])
+def test_deduplicate_matches_exact(aggregator, unique_count):
+    targets = _synthetic_targets(unique_count)
+    assert aggregator._deduplicate_targets(targets) == _exact_deduplicate(aggregator, targets)
+
+
+def test_deduplicate_without_numba_matches_exact(aggregator, monkeypatch):
+    monkeypatch.setattr(result_aggregator, "numba", None)
+    targets = _synthetic_targets(700, seed=1)
+    assert aggregator._deduplicate_targets(targets) == _exact_deduplicate(aggregator, targets)
+
+
+def test_token_encoder_loads_lazily_once(monkeypatch):
+    pytest.importorskip("tiktoken")
+    calls = []
+
+    def failing_get_encoding(name):
+        calls.append(name)
+        raise OSError("无法下载编码文件")
+
+    monkeypatch.setattr(result_aggregator, "_token_encoder", None)
+    monkeypatch.setattr(result_aggregator, "_token_encoder_loaded", False)
+    monkeypatch.setattr(result_aggregator.tiktoken, "get_encoding", failing_get_encoding)
+
+    aggregator = ResultAggregator()
+    assert calls == []
+
+    content = "测试内容。" * 2000
+    for _ in range(2):
+        optimized = aggregator.optimize_for_token_limit(content, max_tokens=100)
+        assert len(optimized) < len(content)
+    assert calls == ["cl100k_base"]
+
+
+def test_token_encoder_can_be_disabled_in_config(monkeypatch):
+    pytest.importorskip("tiktoken")
+    calls = []
+    monkeypatch.setattr(result_aggregator, "_token_encoder", None)
+    monkeypatch.setattr(result_aggregator, "_token_encoder_loaded", False)
+    monkeypatch.setattr(result_aggregator.tiktoken, "get_encoding", calls.append)
+    monkeypatch.setitem(result_aggregator.QUERY_CONFIG, "use_tiktoken", False)
+
+    assert result_aggregator._get_token_encoder() is None
+    assert calls == []
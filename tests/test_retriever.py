@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+检索引擎测试（向量存储使用假实现，不加载模型）
+"""
+
+import importlib
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def retriever_module(monkeypatch):
+    embedding_module = types.ModuleType("embedding_manager")
+    embedding_module.get_embedding_manager = lambda **kwargs: None
+    monkeypatch.setitem(sys.modules, "embedding_manager", embedding_module)
+    for name in ("vector_store", "retriever"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    module = importlib.import_module("retriever")
+    for name in ("vector_store", "retriever"):
+        monkeypatch.delitem(sys.modules, name)
+    return module
+
+
+def test_smart_retrieve_cache_is_cleared_when_store_changes(retriever_module, monkeypatch):
+    store = types.SimpleNamespace(chunks=[], generation=0)
+    retriever = retriever_module.RAGRetriever(vector_store=store)
+    calls = []
+
+    def retrieve_by_intent(query, intent, max_context_chars):
+        calls.append(query)
+        return retriever_module.RetrievalResult(
+            chunks=[], provinces=set(), query_type="general", retrieval_strategy="general"
+        )
+
+    monkeypatch.setattr(retriever, "_retrieve_by_intent", retrieve_by_intent)
+
+    first = retriever.smart_retrieve("北京的主要目标")
+    assert retriever.smart_retrieve("北京的主要目标") is first
+    assert len(calls) == 1
+
+    # 重新加载后块列表可能是数量相同、地址被复用的新列表，缓存仍须失效
+    store.chunks = []
+    store.generation += 1
+    assert retriever.smart_retrieve("北京的主要目标") is not first
+    assert len(calls) == 2
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+向量存储测试（embedding使用按文本生成的确定性假向量，不加载模型）
+"""
+
+import importlib
+import sys
+import types
+import zlib
+
+import numpy as np
+import pytest
+
+from data_processor import DocumentChunk
+
+DIM = 16
+
+
+class FakeEmbeddingManager:
+    """按文本内容生成确定性向量，并记录每次编码的文本"""
+
+    def __init__(self):
+        self.calls = []
+
+    def is_model_loaded(self):
+        return True
+
+    def encode_texts(self, texts, batch_size=32, show_progress=True, total=None):
+        texts = list(texts)
+        self.calls.append(texts)
+        return np.stack([
+            np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(DIM).astype(np.float32)
+            for text in texts
+        ]) if texts else np.empty((0, DIM), dtype=np.float32)
+
+
+@pytest.fixture
+def vector_store_module(monkeypatch):
+    embedding_module = types.ModuleType("embedding_manager")
+    embedding_module.get_embedding_manager = lambda **kwargs: FakeEmbeddingManager()
+    monkeypatch.setitem(sys.modules, "embedding_manager", embedding_module)
+    monkeypatch.delitem(sys.modules, "vector_store", raising=False)
+    module = importlib.import_module("vector_store")
+    monkeypatch.delitem(sys.modules, "vector_store")
+    return module
+
+
+@pytest.fixture
+def make_store(vector_store_module, tmp_path):
+    def factory(chunks=None, **kwargs):
+        embedding_manager = FakeEmbeddingManager()
+        store = vector_store_module.VectorStore(
+            str(tmp_path / "store"), embedding_dim=DIM, index_type="flat",
+            embedding_manager=embedding_manager, **kwargs
+        )
+        if chunks is not None:
+            assert store.build_index(chunks)
+        embedding_manager.calls.clear()
+        return store, embedding_manager
+    return factory
+
+
+def _chunks(provinces=("北京", "上海", "广东"), per_province=4):
+    return [
+        DocumentChunk(
+            id=f"{province}_{i}", province=province, content=f"{province}第{i}段内容 目标{i}",
+            chunk_type="target" if i % 2 else "content", metadata={"section": i},
+            char_count=10 + i, source=f"{province}.docx", start_pos=i * 10, end_pos=i * 10 + 9,
+            chunk_id=i
+        )
+        for province in provinces
+        for i in range(per_province)
+    ]
+
+
+def _assert_same_hits(hits, expected):
+    """同一查询单条检索与批量检索的结果一致（分数允许矩阵乘法路径的浮点误差）"""
+    assert [chunk.id for chunk, _ in hits] == [chunk.id for chunk, _ in expected]
+    np.testing.assert_allclose([score for _, score in hits], [score for _, score in expected], rtol=1e-5)
+
+
+def test_search_batch_with_full_cache_mixing_hits_and_misses(make_store, vector_store_module, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "_QUERY_CACHE_SIZE", 2)
+    store, embedding_manager = make_store(_chunks())
+
+    store.search_batch(["a", "b"], top_k=3)
+    results = store.search_batch(["a", "c", "d", "a"], top_k=3)
+
+    assert embedding_manager.calls == [["a", "b"], ["c", "d"]]
+    assert all(len(hits) == 3 for hits in results)
+    assert [[chunk.id for chunk, _ in hits] for hits in results] == [
+        [chunk.id for chunk, _ in store.search(query, top_k=3)] for query in ["a", "c", "d", "a"]
+    ]
+    assert len(store._query_embedding_cache) == 2
+
+
+def test_statistics_are_recomputed_after_rebuild(make_store):
+    store, _ = make_store(_chunks(provinces=("北京", "上海")))
+    assert set(store.get_statistics()["province_stats"]) == {"北京", "上海"}
+
+    assert store.build_index(_chunks(provinces=("广东", "四川")))
+
+    stats = store.get_statistics()
+    assert set(stats["province_stats"]) == {"广东", "四川"}
+    assert stats["province_stats"]["广东"] == {"count": 4, "total_chars": 10 + 11 + 12 + 13}
+
+
+def test_omp_threads_untouched_unless_configured(make_store, vector_store_module):
+    faiss = vector_store_module.faiss
+    original = faiss.omp_get_max_threads()
+    try:
+        faiss.omp_set_num_threads(1)
+        make_store()
+        assert faiss.omp_get_max_threads() == 1
+
+        make_store(omp_threads=2)
+        make_store(omp_threads=3)
+        assert faiss.omp_get_max_threads() == 2
+    finally:
+        faiss.omp_set_num_threads(original)
+
+
+def test_metadata_that_json_would_change_is_pickled(make_store, vector_store_module, tmp_path):
+    chunks = _chunks(provinces=("北京",))
+    chunks[0].metadata = {"span": (0, 9), 1: "整数键"}
+    store, _ = make_store(chunks)
+    assert store.save_index()
+    assert not store.columns_file.exists()
+    assert store.chunks_file.exists()
+
+    loaded = vector_store_module.VectorStore(
+        str(tmp_path / "store"), embedding_dim=DIM, embedding_manager=FakeEmbeddingManager()
+    )
+    assert loaded.load_index()
+    assert loaded.chunks[0].metadata == {"span": (0, 9), 1: "整数键"}
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(make_store, vector_store_module, tmp_path, mmap):
+    chunks = _chunks()
+    store, _ = make_store(chunks)
+    assert store.save_index()
+    assert store.columns_file.exists()
+
+    loaded = vector_store_module.VectorStore(
+        str(tmp_path / "store"), embedding_dim=DIM, mmap=mmap, embedding_manager=FakeEmbeddingManager()
+    )
+    assert loaded.load_index()
+
+    assert loaded.chunks == chunks
+    assert [chunk.metadata for chunk in loaded.chunks] == [chunk.metadata for chunk in chunks]
+    assert [chunk.word_count for chunk in loaded.chunks] == [chunk.word_count for chunk in chunks]
+    np.testing.assert_array_equal(loaded.chunk_embeddings, store.chunk_embeddings)
+    assert loaded.index.ntotal == len(chunks)
+    assert [(c.id, s) for c, s in loaded.search("北京目标", top_k=5)] == [
+        (c.id, s) for c, s in store.search("北京目标", top_k=5)
+    ]
+
+
+def test_search_batch_uses_query_cache(make_store):
+    store, embedding_manager = make_store(_chunks())
+
+    first = store.search_batch(["a", "b", "a"], top_k=3)
+    second = store.search_batch(["b", "c"], top_k=3)
+
+    assert embedding_manager.calls == [["a", "b"], ["c"]]
+    assert store.get_statistics()["query_cache"] == {"size": 3, "hits": 2, "misses": 3}
+    _assert_same_hits(first[0], first[2])
+    _assert_same_hits(second[0], first[1])
+    for query, hits in zip(["a", "b", "a"], first):
+        _assert_same_hits(hits, store.search(query, top_k=3))
+
+
+def test_search_batch_filters_match_search(make_store):
+    store, _ = make_store(_chunks())
+
+    results = store.search_batch(["a", "b"], top_k=2, province_filter="上海", chunk_type_filter="target")
+
+    for query, hits in zip(["a", "b"], results):
+        _assert_same_hits(hits, store.search(query, top_k=2, province_filter="上海", chunk_type_filter="target"))
+        assert all(c.province == "上海" and c.chunk_type == "target" for c, _ in hits)
+
+
+def test_search_grouped_by_province_matches_filtered_search(make_store):
+    store, _ = make_store(_chunks(provinces=("北京", "上海", "广东", "四川")))
+    provinces = ["广东", "北京", "西藏"]
+
+    grouped = store.search_grouped_by_province("主要目标", provinces, top_k_per_province=2, candidate_top_k=6)
+
+    assert list(grouped) == provinces
+    assert grouped["西藏"] == []
+    for province in ["广东", "北京"]:
+        assert grouped[province] == store.search("主要目标", top_k=6, province_filter=province)[:2]
+
+
+def test_quantized_search_reranks_with_exact_scores(make_store):
+    store, _ = make_store(_chunks())
+
+    exact = store.search("a", top_k=5)
+    quantized = store.search("a", top_k=5, quantized=True)
+
+    _assert_same_hits(quantized, exact)